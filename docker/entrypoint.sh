@@ -33,4 +33,17 @@ if [ -n "$DJANGO_SUPERUSER_USERNAME" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ] &&
 fi
 
 
+if [ "$RETRIEVAL_DAEMON" = "1" ]; then
+  # The daemon owns every store on this host, so it also runs ingestion.
+  export RETRIEVAL_DAEMON_SOCKET="${RETRIEVAL_DAEMON_SOCKET:-/tmp/ragchatbot-retrieval.sock}"
+  python manage.py retrieval_daemon --ingest --ingest-threads "${INGEST_WORKERS:-2}" &
+else
+  python manage.py ingest_worker --processes "${INGEST_WORKERS:-2}" &
+fi
+
+if [ "$ASGI" = "1" ]; then
+  export CHAT_STREAM_ASYNC=1
+  exec gunicorn ragchatbot.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --workers 2 --timeout 120
+fi
+
 exec gunicorn ragchatbot.wsgi:application --bind 0.0.0.0:8000 --workers 2 --timeout 120
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from .models import KnowledgeVersion
+from .embedding_backends import get_embeddings_for_backend
+from .query_cache import embed_query_cached
+from . import retrieval_client
+
+def get_kb_version(user_id: int) -> int:
+    v = KnowledgeVersion.objects.filter(user_id=user_id).values_list("version", flat=True).first()
+    return v or 0
+
+def bump_kb_version(user_id: int):
+    obj, created = KnowledgeVersion.objects.get_or_create(user_id=user_id, defaults={"version": 1})
+    if not created:
+        KnowledgeVersion.objects.filter(user_id=user_id).update(version=F("version") + 1)
+    answer_cache.invalidate_user(user_id)
+    # Every knowledge base write ends here, so this is where the retrieval
+    # daemon (if any) learns to reopen the user's stores.
+    retrieval_client.notify_invalidate(user_id, kinds=["chroma_clients", "vectorstores"])
+
+# Only the last exchange goes into the key: enough to tell a follow-up
+# ("and why?") in one thread from the same words in another, without making
+# every later turn of a chat unique.
+HISTORY_DIGEST_MESSAGES = 2
+
+def _chunk_key(d) -> str:
+    return getattr(d, "id", None) or hashlib.sha1(d.page_content.encode("utf-8")).hexdigest()
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+class AnswerCache:
+    def __init__(self, max_entries: int, threshold: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._seq = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_id: int, key: tuple, prompt: str, qvec):
+        # Same normalised prompt, or a near-identical embedding, under one key.
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for eid, (uid, k, p, vec, _answer) in self._entries.items():
+                if uid != user_id or k != key:
+                    continue
+                sim = 1.0 if p == prompt else float(np.dot(vec, qvec))
+                if sim >= best_sim:
+                    best_id, best_sim = eid, sim
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][4]
+
+    def store(self, user_id: int, key: tuple, prompt: str, qvec, answer: str):
+        with self._lock:
+            self._seq += 1
+            self._entries[self._seq] = (user_id, key, prompt, qvec, answer)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for eid in [e for e, v in self._entries.items() if v[0] == user_id]:
+                del self._entries[eid]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+answer_cache = AnswerCache(
+    getattr(settings, "ANSWER_CACHE_MAX_ENTRIES", 2000),
+    getattr(settings, "ANSWER_CACHE_THRESHOLD", 0.95),
+)
+
+class AnswerProbe:
+    def __init__(self, user_id: int, key: tuple, prompt: str, qvec, answer):
+        self.user_id = user_id
+        self.key = key
+        self.prompt = prompt
+        self.qvec = qvec
+        self.answer = answer
+
+    def store(self, answer: str):
+        if answer.strip():
+            answer_cache.store(self.user_id, self.key, self.prompt, self.qvec, answer)
+
+def probe_answer_cache(user, prompt: str, docs, history, cfg):
+    # Answers are only cached when they are grounded in retrieved chunks; with
+    # no docs there's nothing to key on, so skip the extra query embedding.
+    if not getattr(settings, "ANSWER_CACHE_ENABLED", False) or not docs:
+        return None
+
+    backend = docs[0].metadata.get("kb_backend")
+    try:
+        # Usually a hit: retrieval embedded the same prompt moments ago.
+        vec, _hit = embed_query_cached(get_embeddings_for_backend(user, backend), backend, prompt)
+        vec = np.asarray(vec, dtype=np.float32)
+    except Exception:
+        return None
+    norm = float(np.linalg.norm(vec))
+    if norm == 0:
+        return None
+    qvec = vec / norm
+
+    recent = history[-HISTORY_DIGEST_MESSAGES:] if HISTORY_DIGEST_MESSAGES else []
+    history_hash = hashlib.sha1(json.dumps(recent, sort_keys=True).encode("utf-8")).hexdigest()
+    key = (
+        backend,
+        tuple(sorted(_chunk_key(d) for d in docs)),
+        cfg.provider, cfg.model, float(cfg.temperature),
+        history_hash,
+        get_kb_version(user.id),
+    )
+    normalized = normalize_prompt(prompt)
+    return AnswerProbe(user.id, key, normalized, qvec, answer_cache.lookup(user.id, key, normalized, qvec))
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class RagchatbotConfig(AppConfig):
+    name = "ragchatbot"
+
+    def ready(self):
+        from .db_tuning import install
+        install()
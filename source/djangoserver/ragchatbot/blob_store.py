@@ -0,0 +1,88 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are serialised.
+    fcntl = None
+
+from django.core.files.storage import default_storage
+
+from .models import KnowledgeFile
+
+# Uploads are stored once per content under blobs/<aa>/<sha256><ext>, so the
+# same bytes uploaded by several users (or twice by one) share a file on disk.
+BLOB_DIR = "blobs"
+
+def blob_name(sha256: str, ext: str) -> str:
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}{ext.lower()}"
+
+_thread_lock = threading.Lock()
+
+@contextmanager
+def _blob_lock():
+    # Serialises "does anything still point at this blob?" in release_file
+    # against a new upload reusing the blob and creating its row.
+    root = Path(default_storage.path(BLOB_DIR))
+    root.mkdir(parents=True, exist_ok=True)
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(root / ".lock", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+@contextmanager
+def save_upload_blob(uploaded_file):
+    # Hash while copying the upload's chunks to a temp file next to the blob
+    # store, then move it into place unless an identical blob already exists.
+    # Yields (sha256, name) while holding the blob lock: create the row that
+    # references the blob inside the block so release_file can't remove it
+    # in between. Don't call release_file inside the block.
+    ext = os.path.splitext(uploaded_file.name)[1]
+    root = Path(default_storage.path(BLOB_DIR))
+    root.mkdir(parents=True, exist_ok=True)
+
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=root, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in uploaded_file.chunks():
+                h.update(chunk)
+                out.write(chunk)
+
+        sha256 = h.hexdigest()
+        name = blob_name(sha256, ext)
+        path = Path(default_storage.path(name))
+        with _blob_lock():
+            if path.exists():
+                os.unlink(tmp)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, path)
+            yield sha256, name
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+def release_file(name: str):
+    # Call after the KnowledgeFile row is gone; the blob stays while any other
+    # row (any user) still points at it.
+    if not name:
+        return
+    with _blob_lock():
+        if KnowledgeFile.objects.filter(file=name).exists():
+            return
+        try:
+            if default_storage.exists(name):
+                default_storage.delete(name)
+        except Exception:
+            pass
@@ -1,6 +1,10 @@
+import base64
 import json
+from datetime import datetime
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Length
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods, require_POST
+from django.views.decorators.http import condition, require_http_methods, require_POST
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
 
@@ -10,13 +14,64 @@ def _title_from(text: str) -> str:
     t = (text or "").strip().replace("\n", " ")
     return (t[:60] + "...") if len(t) > 60 else (t or "New chat")
 
+def _limit(request, default: int = 50, maximum: int = 200) -> int:
+    try:
+        return max(1, min(int(request.GET.get("limit", default)), maximum))
+    except ValueError:
+        return default
+
+def _encode_cursor(ts, pk: int) -> str:
+    raw = f"{ts.isoformat()}|{pk}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_cursor(cursor: str):
+    try:
+        ts, pk = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(ts), int(pk)
+    except Exception:
+        return None
+
+def _chats_etag(request):
+    if request.method != "GET":
+        return None
+    agg = Chat.objects.filter(user=request.user).aggregate(n=Count("id"), last=Max("updated_at"))
+    last = agg["last"].isoformat() if agg["last"] else ""
+    return f'chats-{request.user.id}-{agg["n"]}-{last}-{request.GET.urlencode()}'
+
+def _messages_etag(request, chat_id: int):
+    chat = Chat.objects.filter(id=chat_id, user=request.user).values("updated_at").first()
+    if chat is None:
+        return None
+    agg = Message.objects.filter(chat_id=chat_id).aggregate(n=Count("id"), last=Max("id"))
+    # Streaming checkpoints rewrite the last message in place without
+    # touching the chat, so its length and partial flag go in as well.
+    tail = (
+        Message.objects.filter(chat_id=chat_id).order_by("-id")
+        .annotate(size=Length("content")).values("size", "is_partial").first()
+    ) or {"size": 0, "is_partial": False}
+    return (
+        f'msgs-{chat_id}-{chat["updated_at"].isoformat()}-{agg["n"]}-{agg["last"]}'
+        f'-{tail["size"]}-{int(tail["is_partial"])}-{request.GET.urlencode()}'
+    )
+
 @login_required
 @require_http_methods(["GET", "POST"])
+@condition(etag_func=_chats_etag)
 def chats_api(request):
     if request.method == "GET":
-        qs = Chat.objects.filter(user=request.user).order_by("-updated_at")
+        limit = _limit(request)
+        qs = Chat.objects.filter(user=request.user).order_by("-updated_at", "-id")
+
+        cursor = _decode_cursor(request.GET.get("cursor", ""))
+        if cursor:
+            ts, pk = cursor
+            qs = qs.filter(Q(updated_at__lt=ts) | Q(updated_at=ts, id__lt=pk))
+
+        rows = list(qs.values("id", "title", "updated_at")[:limit + 1])
+        next_cursor = _encode_cursor(rows[limit - 1]["updated_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
         return JsonResponse({
-            "chats": [{"id": c.id, "title": c.title, "updated_at": c.updated_at.isoformat()} for c in qs]
+            "chats": [{"id": c["id"], "title": c["title"], "updated_at": c["updated_at"].isoformat()} for c in rows[:limit]],
+            "next_cursor": next_cursor,
         })
 
     payload = json.loads(request.body.decode("utf-8") or "{}")
@@ -26,15 +81,30 @@ def chats_api(request):
 
 @login_required
 @require_http_methods(["GET"])
+@condition(etag_func=_messages_etag)
 def chat_messages_api(request, chat_id: int):
-    chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-    msgs = chat.messages.order_by("created_at")
+    chat = get_object_or_404(Chat.objects.only("id", "title"), id=chat_id, user=request.user)
+    limit = _limit(request, default=100, maximum=500)
+
+    # Newest page first; "before" walks back towards the start of the chat.
+    qs = Message.objects.filter(chat=chat).order_by("-created_at", "-id")
+    cursor = _decode_cursor(request.GET.get("before", ""))
+    if cursor:
+        ts, pk = cursor
+        qs = qs.filter(Q(created_at__lt=ts) | Q(created_at=ts, id__lt=pk))
+
+    rows = list(qs.values("id", "role", "content", "is_partial", "created_at")[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+
     return JsonResponse({
         "chat": {"id": chat.id, "title": chat.title},
         "messages": [
-            {"id": m.id, "role": m.role, "content": m.content, "is_partial": m.is_partial, "created_at": m.created_at.isoformat()}
-            for m in msgs
+            {"id": m["id"], "role": m["role"], "content": m["content"], "is_partial": m["is_partial"], "created_at": m["created_at"].isoformat()}
+            for m in rows
         ],
+        "before_cursor": _encode_cursor(rows[0]["created_at"], rows[0]["id"]) if has_more else None,
     })
 
 @login_required
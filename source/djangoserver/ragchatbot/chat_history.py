@@ -0,0 +1,67 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from .models import Chat, LLMSettings, Message
+from .llm_backends import get_chat_llm
+
+# Once more than HISTORY_WINDOW messages sit after the summary, all but the
+# newest HISTORY_KEEP are folded into it, so one summary call covers several turns.
+HISTORY_WINDOW = getattr(settings, "HISTORY_WINDOW", 16)
+HISTORY_KEEP = getattr(settings, "HISTORY_KEEP", 8)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the summary with the new messages. Keep facts, names, decisions and open "
+    "questions; drop pleasantries. Reply with the updated summary only."
+)
+
+logger = logging.getLogger(__name__)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarize")
+
+def load_history(chat, exclude_id=None):
+    # Capped at the newest HISTORY_WINDOW messages, so a summary that failed
+    # or is still running can't let the prompt grow with the chat's age.
+    qs = Message.objects.filter(chat=chat, id__gt=chat.summary_upto)
+    if exclude_id is not None:
+        qs = qs.exclude(id=exclude_id)
+    rows = list(qs.order_by("-id").values_list("role", "content")[:HISTORY_WINDOW])
+    return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+def update_summary(chat_id: int):
+    chat = Chat.objects.get(id=chat_id)
+    rows = list(
+        Message.objects.filter(chat=chat, id__gt=chat.summary_upto)
+        .order_by("id").values_list("id", "role", "content")
+    )
+    if len(rows) <= HISTORY_WINDOW:
+        return False
+
+    fold = rows[:len(rows) - HISTORY_KEEP]
+    transcript = "\n\n".join(f"{role}: {content}" for _id, role, content in fold)
+    cfg = LLMSettings.objects.get(user_id=chat.user_id)
+    llm = get_chat_llm(cfg)
+    result = llm.invoke([
+        SystemMessage(content=SUMMARY_PROMPT),
+        HumanMessage(content=f"Current summary:\n{chat.summary or '(none)'}\n\nNew messages:\n{transcript}"),
+    ])
+
+    # Conditional on summary_upto so a concurrent update for the same chat can't be overwritten.
+    return bool(Chat.objects.filter(id=chat.id, summary_upto=chat.summary_upto).update(
+        summary=(result.content or "").strip(),
+        summary_upto=fold[-1][0],
+    ))
+
+def _run_summary(chat_id: int):
+    try:
+        update_summary(chat_id)
+    except Exception:
+        logger.exception("Summarising chat %s failed", chat_id)
+    finally:
+        close_old_connections()
+
+def schedule_summary(chat_id: int):
+    _executor.submit(_run_summary, chat_id)
@@ -0,0 +1,80 @@
+import asyncio
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+
+# SQLite tuning applied on connect, plus retry-with-backoff for writes that
+# hit "database is locked" despite busy_timeout (e.g. a checkpoint write
+# racing a long ingest transaction).
+
+LOCK_RETRIES = 5
+
+_stats_lock = threading.Lock()
+lock_retries = 0
+lock_failures = 0
+
+def _configure(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(getattr(settings, 'SQLITE_BUSY_TIMEOUT_MS', 3000))}")
+        cursor.execute(f"PRAGMA mmap_size={int(getattr(settings, 'SQLITE_MMAP_SIZE', 0))}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+
+def install():
+    connection_created.connect(_configure, dispatch_uid="ragchatbot.db_tuning")
+
+def is_lock_error(exc) -> bool:
+    msg = str(exc).lower()
+    return isinstance(exc, OperationalError) and ("locked" in msg or "busy" in msg)
+
+def _count(failed: bool):
+    global lock_retries, lock_failures
+    with _stats_lock:
+        if failed:
+            lock_failures += 1
+        else:
+            lock_retries += 1
+
+def _should_retry(exc, attempt: int, in_atomic: bool = False) -> bool:
+    # Inside atomic() the transaction is already broken; let the outer block fail.
+    if not is_lock_error(exc) or in_atomic:
+        return False
+    if attempt == LOCK_RETRIES:
+        _count(failed=True)
+        return False
+    _count(failed=False)
+    return True
+
+def _delay(attempt: int) -> float:
+    base = 0.05 * (2 ** attempt)
+    return base + random.uniform(0, base)
+
+def retry_on_lock(fn, *args, **kwargs):
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except OperationalError as e:
+            if not _should_retry(e, attempt, connection.in_atomic_block):
+                raise
+            time.sleep(_delay(attempt))
+
+async def aretry_on_lock(fn, *args, **kwargs):
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return await fn(*args, **kwargs)
+        except OperationalError as e:
+            # Async ORM calls run outside any caller-held transaction.
+            if not _should_retry(e, attempt):
+                raise
+            await asyncio.sleep(_delay(attempt))
+
+def lock_stats():
+    with _stats_lock:
+        return {"retries": lock_retries, "failures": lock_failures}
@@ -1,14 +1,20 @@
+from django.conf import settings
+
 from .models import LLMSettings
 from .crypto import decrypt_str
+from .embedding_cache import CachedEmbeddings
+from .pools import pooled
 
 EMBED_DEFAULTS = {
     "openai": ("text-embedding-3-small", 1536),
     "google": ("text-embedding-004", None),
     "ollama": ("nomic-embed-text", 768),
+    "fake": ("hash-384", 384),
 }
 
-def get_embeddings_for_backend(user, backend: str):
+def _build_embeddings(user, backend: str):
     cfg, _ = LLMSettings.objects.get_or_create(user=user)
+    timeout = getattr(settings, "EMBED_REQUEST_TIMEOUT_S", 30.0)
 
     if backend == "openai":
         from langchain_openai import OpenAIEmbeddings
@@ -16,7 +22,7 @@ def get_embeddings_for_backend(user, backend: str):
         if not key:
             raise ValueError("Missing OpenAI API key (needed to search OpenAI-embedded knowledge).")
         model, _dim = EMBED_DEFAULTS["openai"]
-        return OpenAIEmbeddings(model=model, api_key=key)
+        return OpenAIEmbeddings(model=model, api_key=key, request_timeout=timeout)
 
     if backend == "google":
         from langchain_google_genai import GoogleGenerativeAIEmbeddings
@@ -24,12 +30,33 @@ def get_embeddings_for_backend(user, backend: str):
         if not key:
             raise ValueError("Missing Google API key (needed to search Google-embedded knowledge).")
         model, _dim = EMBED_DEFAULTS["google"]
-        return GoogleGenerativeAIEmbeddings(model=model, google_api_key=key)
+        return GoogleGenerativeAIEmbeddings(model=model, google_api_key=key, request_options={"timeout": timeout})
 
     if backend == "ollama":
         from langchain_ollama import OllamaEmbeddings
         base_url = (cfg.ollama_base_url or "http://localhost:11434").strip()
         model, _dim = EMBED_DEFAULTS["ollama"]
-        return OllamaEmbeddings(model=model, base_url=base_url)
+        return OllamaEmbeddings(model=model, base_url=base_url, client_kwargs={"timeout": timeout})
+
+    if backend == "fake" and getattr(settings, "FAKE_PROVIDERS", False):
+        from .fake_providers import HashEmbeddings
+        _model, dim = EMBED_DEFAULTS["fake"]
+        return HashEmbeddings(dim)
 
     raise ValueError(f"Unknown embedding backend: {backend}")
+
+def _build_cached_embeddings(user, backend: str):
+    emb = _build_embeddings(user, backend)
+    # Hash embeddings are cheaper to recompute than to look up, and keeping
+    # them out of the cache keeps benchmark runs independent of each other.
+    if not settings.EMBED_CACHE_ENABLED or backend == "fake":
+        return emb
+    model, _dim = EMBED_DEFAULTS[backend]
+    return CachedEmbeddings(emb, backend, model)
+
+def get_embeddings_for_backend(user, backend: str):
+    # Keyed by the settings row's updated_at so other workers pick up new keys too.
+    version = LLMSettings.objects.filter(user=user).values_list("updated_at", flat=True).first()
+    if version is None:
+        return _build_cached_embeddings(user, backend)
+    return pooled(user.id, "embeddings", (backend, version), lambda: _build_cached_embeddings(user, backend))
@@ -0,0 +1,178 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS emb (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    vec BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS emb_last_used ON emb (last_used);
+"""
+
+# SQLite caps bound parameters per statement; stay well under it.
+_SELECT_BATCH = 500
+_EVICT_EVERY = 1000
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vec) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(blob: bytes):
+    a = array("f")
+    a.frombytes(blob)
+    return a.tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, path, max_entries: int):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self.hits = {}
+        self.misses = {}
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter: dict, ns: str, n: int):
+        if n:
+            with self._lock:
+                counter[ns] = counter.get(ns, 0) + n
+
+    def get_many(self, ns: str, keys):
+        found = {}
+        uniq = list(dict.fromkeys(keys))
+        conn = self._conn()
+        for i in range(0, len(uniq), _SELECT_BATCH):
+            batch = uniq[i:i + _SELECT_BATCH]
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vec FROM emb WHERE ns = ? AND key IN ({marks})", [ns, *batch]
+            ).fetchall()
+            for k, blob in rows:
+                found[k] = _unpack(blob)
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "UPDATE emb SET last_used = ? WHERE ns = ? AND key = ?",
+                    [(now, ns, k) for k in found],
+                )
+        self._count(self.hits, ns, sum(1 for k in keys if k in found))
+        self._count(self.misses, ns, sum(1 for k in keys if k not in found))
+        return found
+
+    def put_many(self, ns: str, items):
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO emb (ns, key, vec, last_used) VALUES (?, ?, ?, ?)",
+                [(ns, k, _pack(v), now) for k, v in items],
+            )
+        with self._lock:
+            self._writes_since_evict += len(items)
+            due = self._writes_since_evict >= _EVICT_EVERY
+            if due:
+                self._writes_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        (count,) = conn.execute("SELECT COUNT(*) FROM emb").fetchone()
+        extra = count - self.max_entries
+        if extra > 0:
+            with conn:
+                conn.execute(
+                    "DELETE FROM emb WHERE rowid IN "
+                    "(SELECT rowid FROM emb ORDER BY last_used LIMIT ?)",
+                    (extra,),
+                )
+        return max(extra, 0)
+
+    def stats(self):
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses)
+            return {
+                ns: {"hits": self.hits.get(ns, 0), "misses": self.misses.get(ns, 0)}
+                for ns in sorted(namespaces)
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(settings.EMBED_CACHE_PATH, settings.EMBED_CACHE_MAX_ENTRIES)
+    return _cache
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, inner: Embeddings, backend: str, model: str, cache: EmbeddingCache = None):
+        self.inner = inner
+        self.backend = backend
+        self.model = model
+        self.ns = f"{backend}:{model}"
+        self.cache = cache or get_embedding_cache()
+
+    def embed_documents(self, texts):
+        keys = [text_key(t) for t in texts]
+        found = self.cache.get_many(self.ns, keys)
+
+        todo = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in todo:
+                todo[k] = t
+
+        if todo:
+            vectors = self.inner.embed_documents(list(todo.values()))
+            fresh = list(zip(todo.keys(), vectors))
+            self.cache.put_many(self.ns, fresh)
+            found.update(fresh)
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str):
+        # Some providers embed queries with a different task type than
+        # documents, so they get their own namespace.
+        ns = self.ns + ":q"
+        k = text_key(text)
+        found = self.cache.get_many(ns, [k])
+        if k in found:
+            return found[k]
+        vec = self.inner.embed_query(text)
+        self.cache.put_many(ns, [(k, vec)])
+        return vec
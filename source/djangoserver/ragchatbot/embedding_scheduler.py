@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .rag_store import existing_ids, upsert_vectors
+from .metrics import observe, span
+
+DEFAULT_LIMITS = {"batch_size": 64, "in_flight": 2, "rps": 0, "max_retries": 5}
+# How often a caller blocked on embedding (e.g. in rate-limit backoff) gets
+# its heartbeat called, well inside ingest_jobs.STALE_AFTER.
+HEARTBEAT_S = 30.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Providers raise their own exception types, so transient failures are
+# recognised by HTTP status where there is one and by class name otherwise.
+_RETRY_STATUSES = {408, 425, 429}
+_TRANSIENT_NAMES = ("Timeout", "Connect", "RateLimit", "TooManyRequests", "ResourceExhausted",
+                    "ServiceUnavailable", "DeadlineExceeded", "InternalServerError")
+
+
+def _status_of(exc):
+    for status in (getattr(exc, "status_code", None),
+                   getattr(getattr(exc, "response", None), "status_code", None),
+                   getattr(exc, "code", None)):
+        if isinstance(status, int) and not isinstance(status, bool):
+            return status
+    return None
+
+
+def is_transient(exc) -> bool:
+    # Rate limits, timeouts, dropped connections and 5xx are worth retrying;
+    # auth, bad-model and validation errors fail the same way every time.
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = _status_of(exc)
+    if status is not None:
+        return status in _RETRY_STATUSES or 500 <= status < 600
+    return any(n in cls.__name__ for cls in type(exc).__mro__ for n in _TRANSIENT_NAMES)
+
+
+def as_completed_alive(fs, heartbeat=None):
+    # as_completed that calls heartbeat() from the waiting thread whenever
+    # HEARTBEAT_S pass without any future finishing.
+    pending = set(fs)
+    while pending:
+        done, pending = wait(pending, timeout=HEARTBEAT_S if heartbeat else None, return_when=FIRST_COMPLETED)
+        if not done:
+            heartbeat()
+        yield from done
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def limits_for_backend(backend: str):
+    conf = dict(DEFAULT_LIMITS)
+    conf.update(getattr(settings, "EMBED_LIMITS", {}).get(backend, {}))
+    return conf
+
+
+def _bucket_for(backend: str, rps: float):
+    with _buckets_lock:
+        b = _buckets.get(backend)
+        if b is None or b.rate != rps:
+            b = _buckets[backend] = TokenBucket(rps)
+        return b
+
+
+class EmbeddingScheduler:
+    def __init__(self, embeddings, backend: str):
+        conf = limits_for_backend(backend)
+        self.embeddings = embeddings
+        self.batch_size = max(1, int(conf["batch_size"]))
+        self.in_flight = max(1, int(conf["in_flight"]))
+        self.max_retries = int(conf["max_retries"])
+        self.bucket = _bucket_for(backend, float(conf["rps"]))
+
+    @property
+    def window(self) -> int:
+        return self.batch_size * self.in_flight
+
+    def _embed_batch(self, texts):
+        # Returns (vectors, seconds spent in the provider call).
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                t0 = time.perf_counter()
+                return self.embeddings.embed_documents(texts), time.perf_counter() - t0
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient(e):
+                    raise
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, 60.0)
+
+    def embed_and_write(self, vs, chunks, ids, on_batch=None, timings=None, heartbeat=None):
+        # Chunks already in the collection (from an earlier, interrupted run)
+        # are skipped, so a retried job resumes where it stopped. heartbeat
+        # is called while batches are stuck in retry backoff.
+        have = existing_ids(vs, ids)
+        todo = [(c, i) for c, i in zip(chunks, ids) if i not in have]
+        if on_batch and len(todo) < len(chunks):
+            on_batch(len(chunks) - len(todo))
+
+        batches = [todo[i:i + self.batch_size] for i in range(0, len(todo), self.batch_size)]
+        if not batches:
+            return 0
+
+        written = 0
+        with ThreadPoolExecutor(max_workers=self.in_flight) as pool:
+            futures = {
+                pool.submit(self._embed_batch, [c.page_content for c, _ in batch]): batch
+                for batch in batches
+            }
+            for fut in as_completed_alive(futures, heartbeat):
+                batch = futures[fut]
+                vectors, seconds = fut.result()
+                observe("ingest", "embed", seconds, timings)
+                with span("ingest", "write", timings):
+                    upsert_vectors(vs, [i for _, i in batch], vectors, [c for c, _ in batch])
+                written += len(batch)
+                if on_batch:
+                    on_batch(len(batch))
+        return written
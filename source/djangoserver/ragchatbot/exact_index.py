@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Read-side mirror of a small collection: a memory-mapped float32 matrix of
+# L2-normalised vectors plus a parallel JSON array of ids/documents/metadata.
+# Chroma stays the source of truth; every write through the store replaces
+# the generation token, which marks the mirror stale in every process.
+#
+# With quantization "int8" or "float16" the mirror holds only compact codes
+# (int8 with one float32 scale per vector, or plain float16) instead of the
+# float32 matrix, so it is 4x / 2x smaller on disk and in the page cache. The
+# best rescore_factor * k rows are rescored against float32 vectors fetched
+# from Chroma. This only covers collections small enough for the mirror;
+# larger ones are served by Chroma's HNSW index, whose storage is unchanged.
+
+QUANTIZATIONS = ("none", "float16", "int8")
+_SCAN_BLOCK = 2048
+
+
+def quantize(m, mode: str):
+    if mode == "int8":
+        scales = np.maximum(np.abs(m).max(axis=1), 1e-12).astype(np.float32) / 127.0
+        codes = np.clip(np.rint(m / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+    if mode == "float16":
+        return m.astype(np.float16), None
+    raise ValueError(f"Unknown quantization: {mode}")
+
+
+def approx_scores(codes, scales, q):
+    out = np.empty(len(codes), dtype=np.float32)
+    for s in range(0, len(codes), _SCAN_BLOCK):
+        out[s:s + _SCAN_BLOCK] = codes[s:s + _SCAN_BLOCK].astype(np.float32) @ q
+    if scales is not None:
+        out *= scales
+    return out
+
+
+def _top(scores, k):
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class ExactIndex:
+    def __init__(self, directory: str, quantization: str = "none", rescore_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.Lock()
+        self._gen = None
+        self.matrix = None
+        self.codes = None
+        self.scales = None
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+
+    @property
+    def _gen_path(self):
+        return self.dir / "gen"
+
+    @property
+    def _rows_path(self):
+        return self.dir / "rows.json"
+
+    def current_gen(self) -> str:
+        try:
+            return self._gen_path.read_text().strip()
+        except FileNotFoundError:
+            return ""
+
+    def invalidate(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.dir / f"gen.{uuid.uuid4().hex}"
+        tmp.write_text(uuid.uuid4().hex)
+        os.replace(tmp, self._gen_path)
+
+    def _load(self, gen: str) -> bool:
+        try:
+            rows = json.loads(self._rows_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return False
+        if rows.get("gen") != gen or rows.get("quantization", "none") != self.quantization:
+            return False
+        n, dim = rows["n"], rows["dim"]
+        matrix = codes = scales = None
+        if not n:
+            matrix = np.zeros((0, dim), dtype=np.float32)
+        elif self.quantization == "none":
+            matrix = np.memmap(self.dir / rows["vectors"], dtype=np.float32, mode="r", shape=(n, dim))
+        else:
+            dtype = np.int8 if self.quantization == "int8" else np.float16
+            codes = np.memmap(self.dir / rows["codes"], dtype=dtype, mode="r", shape=(n, dim))
+            if self.quantization == "int8":
+                scales = np.fromfile(self.dir / rows["scales"], dtype=np.float32)
+        self.matrix, self.codes, self.scales = matrix, codes, scales
+        self.ids, self.documents, self.metadatas = rows["ids"], rows["documents"], rows["metadatas"]
+        self._gen = gen
+        return True
+
+    def fresh(self) -> bool:
+        gen = self.current_gen()
+        with self._lock:
+            if self._gen == gen and (self.matrix is not None or self.codes is not None):
+                return True
+            return self._load(gen)
+
+    def build(self, gen: str, ids, vectors, documents, metadatas):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        m = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1) if ids else np.zeros((0, 0), np.float32)
+        if len(ids):
+            m /= np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+        stamp = uuid.uuid4().hex
+        files = {}
+        if len(ids) and self.quantization == "none":
+            files["vectors"] = f"vectors-{stamp}.f32"
+            m.tofile(self.dir / files["vectors"])
+        elif len(ids):
+            codes, scales = quantize(m, self.quantization)
+            files["codes"] = f"codes-{stamp}.bin"
+            codes.tofile(self.dir / files["codes"])
+            if scales is not None:
+                files["scales"] = f"scales-{stamp}.f32"
+                scales.tofile(self.dir / files["scales"])
+        rows = {
+            "gen": gen, "n": len(ids), "dim": int(m.shape[1]) if len(ids) else 0,
+            "quantization": self.quantization, **files,
+            "ids": list(ids), "documents": list(documents), "metadatas": list(metadatas),
+        }
+        tmp = self.dir / f"rows.{uuid.uuid4().hex}"
+        tmp.write_text(json.dumps(rows))
+        os.replace(tmp, self._rows_path)
+
+        for pattern in ("vectors-*", "codes-*", "scales-*"):
+            for old in self.dir.glob(pattern):
+                if stamp not in old.name:
+                    try:
+                        old.unlink()
+                    except OSError:
+                        pass
+        with self._lock:
+            self._load(gen)
+
+    def clear(self):
+        # Drops the mirror's files; the generation token stays.
+        with self._lock:
+            self._gen, self.matrix, self.codes, self.scales = None, None, None, None
+            self.ids, self.documents, self.metadatas = [], [], []
+        for pattern in ("rows.json", "vectors-*", "codes-*", "scales-*"):
+            for path in self.dir.glob(pattern):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def search(self, query_embedding, k: int, fetch=None):
+        # fetch(ids) -> float32 vectors for those ids, used to rescore the
+        # quantized shortlist. Without it the shortlist is ranked on the
+        # dequantized codes.
+        if not self.ids or (self.matrix is None and self.codes is None):
+            return []
+        q = np.array(query_embedding, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+
+        if self.codes is None:
+            scores = self.matrix @ q
+            top = _top(scores, k)
+            sims, vecs = scores[top], self.matrix[top]
+        else:
+            shortlist = np.sort(_top(approx_scores(self.codes, self.scales, q), k * self.rescore_factor))
+            if fetch is not None:
+                rows = np.asarray(fetch([self.ids[i] for i in shortlist]), dtype=np.float32)
+                rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+            else:
+                rows = self.codes[shortlist].astype(np.float32)
+                if self.scales is not None:
+                    rows *= self.scales[shortlist][:, None]
+            exact = rows @ q
+            order = _top(exact, k)
+            top, sims, vecs = shortlist[order], exact[order], rows[order]
+        return [
+            (
+                Document(id=self.ids[i], page_content=self.documents[i] or "", metadata=dict(self.metadatas[i] or {})),
+                float(1.0 - sim),
+                vec,
+            )
+            for i, sim, vec in zip(top, sims, vecs)
+        ]
+
+
+class TieredVectorStore:
+    # Serves queries from an ExactIndex while the collection holds at most
+    # max_exact chunks and from Chroma's HNSW index above that. Writes always
+    # go to Chroma and invalidate the mirror.
+    def __init__(self, build_chroma, mirror_dir: str, max_exact: int, backend: str, embedding_function,
+                 quantization: str = "none", rescore_factor: int = 4):
+        self._build_chroma = build_chroma
+        self._chroma = None
+        self.backend = backend
+        self._embeddings = embedding_function
+        self.max_exact = max_exact
+        self.exact = ExactIndex(mirror_dir, quantization, rescore_factor)
+        self.last_engine = None
+
+    @property
+    def chroma(self):
+        if self._chroma is None:
+            self._chroma = self._build_chroma()
+        return self._chroma
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def _too_big_marker(self):
+        return self.exact.dir / "too_big"
+
+    def _too_big(self, gen: str) -> bool:
+        marker = self._too_big_marker()
+        return bool(gen) and marker.exists() and marker.read_text() == gen
+
+    def _use_exact(self) -> bool:
+        # Check the marker first: past the threshold the stale rows.json would
+        # otherwise be read and parsed on every query only to be discarded.
+        gen = self.exact.current_gen()
+        if self._too_big(gen):
+            return False
+        if self.exact.fresh():
+            return True
+        if not gen:
+            # Never build against a missing token: a wiped directory would
+            # otherwise look identical to the last mirror held in memory.
+            self.exact.invalidate()
+            gen = self.exact.current_gen()
+
+        data = self.chroma.get(include=["embeddings", "documents", "metadatas"], limit=self.max_exact + 1)
+        ids = data.get("ids") or []
+        if len(ids) > self.max_exact:
+            self._too_big_marker().write_text(gen)
+            self.exact.clear()
+            return False
+        self.exact.build(gen, ids, data.get("embeddings") if ids else [], data.get("documents") or [], data.get("metadatas") or [])
+        return True
+
+    def _fetch_vectors(self, ids):
+        data = self.chroma.get(ids=list(ids), include=["embeddings"])
+        by_id = dict(zip(data.get("ids") or [], data.get("embeddings") if data.get("ids") else []))
+        return [by_id[i] for i in ids]
+
+    def query(self, query_embedding, k: int):
+        if self._use_exact():
+            self.last_engine = "exact"
+            return self.exact.search(query_embedding, k, fetch=self._fetch_vectors)
+        self.last_engine = "hnsw"
+        return self.chroma.query(query_embedding, k)
+
+    def similarity_search_with_score(self, query: str, k: int):
+        qvec = self.embeddings.embed_query(query)
+        return [(d, dist) for d, dist, _vec in self.query(qvec, k)]
+
+    # Everything below delegates to Chroma; writes also invalidate the mirror.
+
+    def get(self, *args, **kwargs):
+        return self.chroma.get(*args, **kwargs)
+
+    def has_data(self) -> bool:
+        if not self._too_big(self.exact.current_gen()) and self.exact.fresh():
+            return bool(self.exact.ids)
+        return self.chroma.has_data()
+
+    def add_documents(self, docs, ids=None):
+        try:
+            return self.chroma.add_documents(docs, ids=ids)
+        finally:
+            self.exact.invalidate()
+
+    def upsert(self, ids, vectors, docs):
+        try:
+            self.chroma.upsert(ids, vectors, docs)
+        finally:
+            self.exact.invalidate()
+
+    def delete(self, ids):
+        try:
+            self.chroma.delete(ids)
+        finally:
+            self.exact.invalidate()
+
+    def delete_all(self):
+        try:
+            self.chroma.delete_all()
+        finally:
+            self.exact.invalidate()
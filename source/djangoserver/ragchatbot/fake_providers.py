@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Deterministic stand-ins for the remote providers, enabled with
+# FAKE_PROVIDERS=1 as backend/provider "fake". They let the benchmarks run
+# the real ingest, retrieval and streaming code with no network.
+
+_WORD = re.compile(r"\w+")
+
+class HashEmbeddings(Embeddings):
+    # Signed feature hashing over lower-cased words: texts sharing words get
+    # similar vectors, so retrieval still returns sensible neighbours.
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    def _embed(self, text: str):
+        vec = [0.0] * self.dim
+        for w in _WORD.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str):
+        return self._embed(text)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    # Streams answer_tokens pseudo-words seeded by the last message, sleeping
+    # token_delay_s before each one to mimic provider latency.
+    token_delay_s: float = 0.02
+    answer_tokens: int = 120
+    model: str = "fake-stream"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-stream"
+
+    def _tokens(self, messages):
+        last = messages[-1].content if messages else ""
+        rng = random.Random(hashlib.sha1(str(last).encode("utf-8")).hexdigest())
+        words = _WORD.findall(str(last)) or ["answer"]
+        return [("" if i == 0 else " ") + rng.choice(words) for i in range(self.answer_tokens)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = "".join(self._tokens(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for tok in self._tokens(messages):
+            if self.token_delay_s:
+                time.sleep(self.token_delay_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=tok))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for tok in self._tokens(messages):
+            if self.token_delay_s:
+                await asyncio.sleep(self.token_delay_s)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=tok))
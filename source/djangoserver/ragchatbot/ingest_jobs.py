@@ -0,0 +1,280 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .models import IngestJob, IngestJobFile, KnowledgeFile
+from .embedding_backends import get_embeddings_for_backend
+from .rag_store import BACKENDS, delete_file_vectors, get_vectorstore_for_backend
+from .ingest_pipeline import ingest_knowledge_file
+from .answer_cache import bump_kb_version
+from .blob_store import release_file
+from .metrics import dump_process_metrics, span
+from .pools import invalidate_user
+from .db_tuning import retry_on_lock
+from . import lexical_index
+
+logger = logging.getLogger(__name__)
+
+# A running job whose row hasn't been touched for this long belongs to a dead
+# worker. Live ones touch it on progress and while waiting out embedding backoff.
+STALE_AFTER = timedelta(minutes=10)
+
+def enqueue_ingest_job(user, backend: str, knowledge_files, skipped=(), extra_backends=()):
+    # skipped: (upload name, existing KnowledgeFile) pairs for unchanged
+    # uploads; they are listed on the job but never ingested.
+    # extra_backends: fan-out targets embedded in the same pass as `backend`.
+    with transaction.atomic():
+        job = IngestJob.objects.create(
+            user=user, backend=backend, extra_backends=list(extra_backends),
+            status="queued" if knowledge_files else "done",
+        )
+        IngestJobFile.objects.bulk_create([
+            IngestJobFile(job=job, knowledge_file=kf, name=kf.original_name)
+            for kf in knowledge_files
+        ] + [
+            IngestJobFile(job=job, knowledge_file=kf, name=name, status="skipped")
+            for name, kf in skipped
+        ])
+    return job
+
+def enqueue_backfill_job(user, backend: str):
+    # Embeds every file that isn't in `backend` yet into it. Files already
+    # waiting in a queued or running job for `backend` are left to that job.
+    # Returns None when there is nothing to do.
+    with transaction.atomic():
+        in_flight = set(
+            IngestJobFile.objects
+            .filter(job__user=user, job__backend=backend, job__status__in=["queued", "running"])
+            .values_list("knowledge_file_id", flat=True)
+        )
+        kfs = [
+            kf for kf in KnowledgeFile.objects.filter(user=user).order_by("id")
+            if backend not in kf.backends and kf.id not in in_flight
+        ]
+        if not kfs:
+            return None
+        return enqueue_ingest_job(user, backend, kfs)
+
+def fanout_backends(user, primary: str):
+    # INGEST_FANOUT_BACKENDS the user can actually embed with right now.
+    out = []
+    for b in getattr(settings, "INGEST_FANOUT_BACKENDS", []):
+        if b == primary or b not in BACKENDS or b in out:
+            continue
+        try:
+            get_embeddings_for_backend(user, b)
+        except ValueError:
+            continue
+        out.append(b)
+    return out
+
+def _record_backends(kf_id: int, backends) -> bool:
+    # Appends to extra_backends on a freshly locked row, so two backfills of
+    # the same file in different workers don't overwrite each other. Returns
+    # False when the file has been deleted meanwhile.
+    with transaction.atomic():
+        kf = KnowledgeFile.objects.select_for_update().filter(id=kf_id).first()
+        if kf is None:
+            return False
+        new = [b for b in backends if b not in kf.backends]
+        if new:
+            kf.extra_backends = kf.backends[1:] + new
+            kf.save(update_fields=["extra_backends"])
+    return True
+
+def _discard_vectors(user_id: int, kf_id: int, stores, lexical: bool):
+    for store in stores:
+        try:
+            delete_file_vectors(store, kf_id)
+        except Exception:
+            logger.exception("Could not remove %s vectors of file %s", store.backend, kf_id)
+    if lexical:
+        lexical_index.delete_file(user_id, kf_id)
+    bump_kb_version(user_id)
+
+def last_ingest_status(kf) -> str:
+    # Outcome of the latest attempt to ingest kf into its own backend.
+    # "skipped" rows only point at it, and backfills target other backends.
+    jf = (
+        kf.ingest_jobs
+        .filter(job__backend=kf.backend)
+        .exclude(status="skipped")
+        .order_by("-id")
+        .first()
+    )
+    # Files from before ingest jobs were indexed inline at upload.
+    return jf.status if jf else "done"
+
+def _duplicate_of(kf):
+    # Two uploads of the same bytes can race past the check in the upload
+    # view; the older row wins and the newer one is dropped before embedding,
+    # unless the older one's ingest failed.
+    if not kf.sha256:
+        return None
+    for other in (
+        KnowledgeFile.objects
+        .filter(user_id=kf.user_id, backend=kf.backend, sha256=kf.sha256, id__lt=kf.id)
+        .order_by("id")
+    ):
+        if last_ingest_status(other) != "failed":
+            return other
+    return None
+
+def ingest_job_to_dict(job):
+    files = job.files.order_by("id")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "error": job.error,
+        "files": [
+            {
+                "name": f.name,
+                "status": f.status,
+                "pages": f.pages_parsed,
+                "chunks": f.chunks_embedded,
+                "chunks_total": f.chunks_total,
+                "error": f.error,
+            }
+            for f in files
+        ],
+    }
+
+def claim_next_job():
+    while True:
+        job = IngestJob.objects.filter(status="queued").order_by("created_at").first()
+        if job is None:
+            return None
+        # Conditional update so two workers can't both take the same job.
+        if IngestJob.objects.filter(id=job.id, status="queued").update(status="running", updated_at=timezone.now()):
+            job.status = "running"
+            return job
+
+def requeue_stale_jobs():
+    cutoff = timezone.now() - STALE_AFTER
+    return IngestJob.objects.filter(status="running", updated_at__lt=cutoff).update(status="queued")
+
+def _touch(job):
+    IngestJob.objects.filter(id=job.id).update(updated_at=timezone.now())
+
+def _drop_pooled(user_id: int):
+    # Pool invalidation is per process: when the web process wipes or
+    # reindexes a collection, or the user rotates a key, this worker still
+    # holds the old handles. A failed job is the signal to reopen them.
+    invalidate_user(user_id, kinds=["chroma_clients", "vectorstores", "embeddings"])
+
+def run_ingest_job(job, timings=None):
+    user = job.user
+    try:
+        embeddings = get_embeddings_for_backend(user, job.backend)
+        vs = get_vectorstore_for_backend(user.id, job.backend, embeddings)
+    except Exception as e:
+        _drop_pooled(user.id)
+        IngestJob.objects.filter(id=job.id).update(status="failed", error=str(e), updated_at=timezone.now())
+        return
+
+    # Fan-out targets are best effort: one that can't be opened (key removed
+    # since upload) is left out rather than failing the primary backend.
+    extra_stores = []
+    for b in job.extra_backends or []:
+        try:
+            extra_stores.append(get_vectorstore_for_backend(user.id, b, get_embeddings_for_backend(user, b)))
+        except Exception:
+            logger.exception("Skipping fan-out backend %s for job %s", b, job.id)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=900, chunk_overlap=120)
+    failed = 0
+
+    for jf in job.files.filter(status__in=["queued", "running"]).select_related("knowledge_file"):
+        kf = jf.knowledge_file
+        if kf is None:
+            IngestJobFile.objects.filter(id=jf.id).update(status="failed", error="File was deleted")
+            failed += 1
+            continue
+
+        # A job for a backend other than the file's own is a backfill: the
+        # text is already in the keyword index and only vectors are missing.
+        backfill = kf.backend != job.backend
+        original = None if backfill else _duplicate_of(kf)
+        if original is not None:
+            IngestJobFile.objects.filter(id=jf.id).update(status="skipped", knowledge_file=original)
+            name = kf.file.name
+            kf.delete()
+            release_file(name)
+            continue
+
+        def on_progress(pages, chunks_total, chunks_embedded, jf_id=jf.id):
+            IngestJobFile.objects.filter(id=jf_id).update(
+                status="running",
+                pages_parsed=pages,
+                chunks_total=chunks_total,
+                chunks_embedded=chunks_embedded,
+            )
+            _touch(job)
+
+        dropped = []
+        try:
+            with span("ingest", "file", timings):
+                ingest_knowledge_file(user, kf, vs, splitter, on_progress=on_progress, timings=timings,
+                                      extra_stores=[] if backfill else extra_stores, lexical=not backfill,
+                                      dropped=dropped, heartbeat=lambda: _touch(job))
+            written = [vs] if backfill else [vs] + [s for s in extra_stores if s.backend not in dropped]
+            if not retry_on_lock(_record_backends, kf.id, [s.backend for s in written]):
+                # Deleted while we were embedding: the delete only knew the
+                # backends recorded at the time, so clear what this pass wrote.
+                _discard_vectors(user.id, kf.id, written, lexical=not backfill)
+                IngestJobFile.objects.filter(id=jf.id).update(status="failed", error="File was deleted")
+                failed += 1
+                continue
+            IngestJobFile.objects.filter(id=jf.id).update(status="done")
+            bump_kb_version(user.id)
+        except Exception as e:
+            # Partial vectors in a backend the file isn't recorded under would
+            # outlive a later delete, as would anything left for a file that
+            # was deleted meanwhile.
+            gone = not KnowledgeFile.objects.filter(id=kf.id).exists()
+            unrecorded = [vs] if backfill or gone else []
+            if not backfill:
+                unrecorded += [s for s in extra_stores if s.backend not in dropped]
+            if unrecorded:
+                _discard_vectors(user.id, kf.id, unrecorded, lexical=gone and not backfill)
+            IngestJobFile.objects.filter(id=jf.id).update(status="failed", error=str(e))
+            failed += 1
+
+    if failed:
+        _drop_pooled(user.id)
+    status = "failed" if failed else "done"
+    error = f"{failed} file(s) failed" if failed else ""
+    IngestJob.objects.filter(id=job.id).update(status=status, error=error, updated_at=timezone.now())
+
+def worker_loop(poll_interval: float = 1.0, stop=None):
+    from django.db import close_old_connections
+
+    while stop is None or not stop.is_set():
+        close_old_connections()
+        try:
+            requeue_stale_jobs()
+            job = claim_next_job()
+        except Exception:
+            logger.exception("Could not claim an ingest job")
+            job = None
+
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        try:
+            run_ingest_job(job)
+        except Exception as e:
+            logger.exception("Ingest job %s failed", job.id)
+            _drop_pooled(job.user_id)
+            IngestJob.objects.filter(id=job.id).update(status="failed", error=str(e), updated_at=timezone.now())
+        # Publish this job's ingest timings right away rather than on the next periodic dump.
+        try:
+            dump_process_metrics()
+        except OSError:
+            logger.exception("Could not write metrics snapshot")
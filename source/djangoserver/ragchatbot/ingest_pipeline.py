@@ -0,0 +1,184 @@
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from langchain_core.documents import Document
+
+from .rag_store import chunk_ids_for_file, delete_file_vectors
+from .pdf_pages import count_pages, extract_pages
+from .embedding_scheduler import EmbeddingScheduler, as_completed_alive
+from .metrics import span
+from . import lexical_index
+
+PDF_PARSE_PROCESSES = getattr(settings, "PDF_PARSE_PROCESSES", 2)
+PDF_PAGES_PER_TASK = 8
+# Page ranges in flight at once; bounds parsed-but-unembedded pages in memory.
+PDF_WINDOW_TASKS = max(2, PDF_PARSE_PROCESSES * 2)
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+def _pdf_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_PARSE_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+def iter_pdf_pages(file_path: str, original_name: str):
+    total = count_pages(file_path)
+    ranges = [(i, min(i + PDF_PAGES_PER_TASK, total)) for i in range(0, total, PDF_PAGES_PER_TASK)]
+
+    def emit(start, texts):
+        for offset, text in enumerate(texts):
+            yield Document(
+                page_content=text,
+                metadata={"source": original_name, "page": start + offset, "total_pages": total},
+            )
+
+    # A daemonic process can't start a pool of its own; parse in place there.
+    in_place = PDF_PARSE_PROCESSES <= 1 or multiprocessing.current_process().daemon
+    if total <= PDF_PAGES_PER_TASK or in_place:
+        for start, stop in ranges:
+            yield from emit(start, extract_pages(file_path, start, stop))
+        return
+
+    # Keep a bounded window of page ranges in flight and yield them in order,
+    # so memory is capped by the window rather than the file.
+    pool = _pdf_pool()
+    pending = deque()
+    it = iter(ranges)
+    for start, stop in islice(it, PDF_WINDOW_TASKS):
+        pending.append((start, pool.submit(extract_pages, file_path, start, stop)))
+    while pending:
+        start, fut = pending.popleft()
+        texts = fut.result()
+        nxt = next(it, None)
+        if nxt is not None:
+            pending.append((nxt[0], pool.submit(extract_pages, file_path, *nxt)))
+        yield from emit(start, texts)
+
+def iter_file_docs(file_path: str, original_name: str):
+    ext = os.path.splitext(original_name.lower())[1]
+    if ext == ".pdf":
+        yield from iter_pdf_pages(file_path, original_name)
+    elif ext in {".txt", ".md"}:
+        from langchain_community.document_loaders import TextLoader
+        for d in TextLoader(file_path, encoding="utf-8").lazy_load():
+            d.metadata["source"] = original_name
+            yield d
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+def load_file_to_docs(file_path: str, original_name: str):
+    return list(iter_file_docs(file_path, original_name))
+
+def _for_backend(chunks, backend: str):
+    return [Document(page_content=c.page_content, metadata={**c.metadata, "kb_backend": backend}) for c in chunks]
+
+def ingest_knowledge_file(user, kf, vs, splitter, on_progress=None, timings=None, extra_stores=(), lexical=True,
+                          dropped=None, heartbeat=None):
+    # vs decides the backend the chunks are tagged with; extra_stores (fan-out)
+    # get the same chunks, embedded concurrently by their own schedulers.
+    # lexical=False skips the keyword index, e.g. when backfilling a file
+    # whose text is already indexed.
+    # Fan-out is best effort: an extra store that fails is dropped for the
+    # rest of the file, its partial vectors removed and its backend appended
+    # to `dropped`. Only a failure of `vs` itself raises.
+    # heartbeat is called periodically while embedding makes no progress.
+    abs_path = default_storage.path(kf.file.name)
+    backend = vs.backend
+    targets = [(s, EmbeddingScheduler(s.embeddings, s.backend)) for s in [vs, *extra_stores]]
+    scheduler = targets[0][1]
+    pages = 0
+    done = 0
+    embedded = [0] * len(targets)
+    active = list(range(1, len(targets)))
+    pending = []
+
+    def report():
+        if on_progress:
+            on_progress(pages=pages, chunks_total=done + len(pending),
+                        chunks_embedded=min(embedded[t] for t in [0, *active]))
+
+    def on_batch_for(t):
+        # Only the primary target reports, so progress rows are written from
+        # the calling thread; fan-out threads just count.
+        def on_batch(n):
+            embedded[t] += n
+            if t == 0:
+                report()
+        return on_batch
+
+    fanout = ThreadPoolExecutor(max_workers=len(targets) - 1) if len(targets) > 1 else None
+
+    def flush(batch):
+        nonlocal done
+        ids = chunk_ids_for_file(kf.id, len(batch), start=done)
+        done += len(batch)
+        futures = [
+            (t, fanout.submit(targets[t][1].embed_and_write, targets[t][0],
+                              _for_backend(batch, targets[t][0].backend), ids,
+                              on_batch=on_batch_for(t), timings=None))
+            for t in active
+        ]
+        scheduler.embed_and_write(vs, batch, ids, on_batch=on_batch_for(0), timings=timings, heartbeat=heartbeat)
+        # A fan-out backend can still be backing off after the primary is done.
+        for _ in as_completed_alive([fut for _, fut in futures], heartbeat):
+            pass
+        for t, fut in futures:
+            try:
+                fut.result()
+            except Exception:
+                active.remove(t)
+                store = targets[t][0]
+                logger.exception("Fan-out to %s failed for file %s; dropping it", store.backend, kf.id)
+                try:
+                    delete_file_vectors(store, kf.id)
+                except Exception:
+                    logger.exception("Could not remove partial %s vectors of file %s", store.backend, kf.id)
+                if dropped is not None:
+                    dropped.append(store.backend)
+        if lexical:
+            with span("ingest", "lexical", timings):
+                lexical_index.add_chunks(user.id, backend, ids, batch)
+
+    try:
+        # Split each page as it arrives and hand full windows to the scheduler.
+        docs = iter_file_docs(abs_path, kf.original_name)
+        while True:
+            with span("ingest", "parse", timings):
+                d = next(docs, None)
+            if d is None:
+                break
+            pages += 1
+            d.metadata["user_id"] = user.id
+            d.metadata["source"] = kf.original_name
+            d.metadata["kb_backend"] = backend
+
+            with span("ingest", "split", timings):
+                split = splitter.split_documents([d])
+            for c in split:
+                c.metadata["kb_file_id"] = kf.id
+                pending.append(c)
+
+            while len(pending) >= scheduler.window:
+                batch, pending = pending[:scheduler.window], pending[scheduler.window:]
+                flush(batch)
+
+        if pending:
+            batch, pending = pending, []
+            flush(batch)
+    finally:
+        if fanout:
+            fanout.shutdown(wait=True)
+    report()
+    return done
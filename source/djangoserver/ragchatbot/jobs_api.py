@@ -0,0 +1,49 @@
+import json
+import time
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import get_object_or_404
+
+from .models import IngestJob
+from .ingest_jobs import ingest_job_to_dict
+from .stream_api import sse
+
+FINISHED = {"done", "failed"}
+# Each open stream holds a sync worker, so a stream only lives this long;
+# EventSource reconnects after RECONNECT_MS and picks up where it left off.
+STREAM_WINDOW_S = 5.0
+RECONNECT_MS = 1000
+
+@login_required
+@require_http_methods(["GET"])
+def ingest_job_api(request, job_id: int):
+    job = get_object_or_404(IngestJob, id=job_id, user=request.user)
+    return JsonResponse(ingest_job_to_dict(job))
+
+@login_required
+@require_http_methods(["GET"])
+def ingest_job_stream_api(request, job_id: int):
+    job = get_object_or_404(IngestJob, id=job_id, user=request.user)
+
+    def generate():
+        deadline = time.monotonic() + STREAM_WINDOW_S
+        yield f"retry: {RECONNECT_MS}\n\n"
+        last = None
+        while True:
+            job.refresh_from_db()
+            data = json.dumps(ingest_job_to_dict(job))
+            if data != last:
+                yield sse("progress", data)
+                last = data
+            if job.status in FINISHED:
+                yield sse("done", data)
+                return
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(0.5)
+
+    resp = StreamingHttpResponse(generate(), content_type="text/event-stream; charset=utf-8")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
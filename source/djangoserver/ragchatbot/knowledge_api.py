@@ -3,20 +3,26 @@ import shutil
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods, require_POST
 from django.contrib.auth.decorators import login_required
-from django.core.files.storage import default_storage
 
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from .models import KnowledgeFile
-from .rag_api import load_file_to_docs
+from .ingest_pipeline import ingest_knowledge_file
 from .embedding_backends import get_embeddings_for_backend
+from .pools import invalidate_user
+from .answer_cache import bump_kb_version
+from .blob_store import release_file
+from . import lexical_index
+from . import retrieval_client
 from .rag_store import (
+    BACKENDS,
     user_chroma_dir,
     get_vectorstore_for_backend,
-    collection_name_for_backend,
+    delete_backend_vectors,
+    delete_file_chunks,
 )
-
-BACKENDS = ["openai", "google", "ollama"]
+from .ingest_jobs import enqueue_ingest_job
 
 def _fmt_size(n: int) -> str:
     for unit in ["B", "KB", "MB", "GB"]:
@@ -35,6 +41,7 @@ def list_knowledge_files(request):
             "id": f.id,
             "name": f.original_name,
             "backend": getattr(f, "backend", "openai"),
+            "backends": f.backends,
             "size_bytes": int(f.size_bytes),
             "size_human": _fmt_size(int(f.size_bytes)),
             "created_at": f.created_at.isoformat(),
@@ -43,35 +50,55 @@ def list_knowledge_files(request):
 
 def _delete_collection(user_id: int, backend: str):
     try:
-        from chromadb import PersistentClient
-        client = PersistentClient(path=user_chroma_dir(user_id))
-        client.delete_collection(collection_name_for_backend(backend))
+        delete_backend_vectors(user_id, backend)
     except Exception:
         pass
+    invalidate_user(user_id, kinds=["vectorstores"])
 
-def _reindex_backend(request, backend: str):
-    _delete_collection(request.user.id, backend)
+def reindex_backend(user, backend: str):
+    _delete_collection(user.id, backend)
+    lexical_index.delete_backend(user.id, backend)
 
-    embeddings = get_embeddings_for_backend(request.user, backend)
-    vs = get_vectorstore_for_backend(request.user.id, backend, embeddings)
+    embeddings = get_embeddings_for_backend(user, backend)
+    vs = get_vectorstore_for_backend(user.id, backend, embeddings)
     splitter = RecursiveCharacterTextSplitter(chunk_size=900, chunk_overlap=120)
 
-    qs = KnowledgeFile.objects.filter(user=request.user, backend=backend).order_by("created_at")
+    files = [kf for kf in KnowledgeFile.objects.filter(user=user).order_by("created_at") if backend in kf.backends]
     total_chunks = 0
 
-    for kf in qs:
-        abs_path = default_storage.path(kf.file.name)
-        docs = load_file_to_docs(abs_path, kf.original_name)
-        for d in docs:
-            d.metadata["user_id"] = request.user.id
-            d.metadata["source"] = kf.original_name
-            d.metadata["kb_backend"] = backend
-
-        chunks = splitter.split_documents(docs)
-        vs.add_documents(chunks)
-        total_chunks += len(chunks)
-
-    return {"backend": backend, "files": qs.count(), "chunks": total_chunks}
+    # Keyword rows are only kept under a file's primary backend.
+    for kf in files:
+        total_chunks += ingest_knowledge_file(user, kf, vs, splitter, lexical=kf.backend == backend)
+    bump_kb_version(user.id)
+
+    return {"backend": backend, "files": len(files), "chunks": total_chunks}
+
+def queue_reindex_backend(user, backend: str):
+    # Like reindex_backend, but the re-embedding runs in the ingest worker.
+    # Files whose primary backend is another one only get their vectors back.
+    _delete_collection(user.id, backend)
+    lexical_index.delete_backend(user.id, backend)
+    files = [kf for kf in KnowledgeFile.objects.filter(user=user).order_by("created_at") if backend in kf.backends]
+    bump_kb_version(user.id)
+    return enqueue_ingest_job(user, backend, files)
+
+def rebuild_lexical_index(user, backend: str):
+    # Copies chunk text out of the existing collection, so no embedding calls.
+    vs = get_vectorstore_for_backend(user.id, backend, None)
+    data = vs.get(include=["documents", "metadatas"])
+    # Fan-out copies of files whose primary backend is another one are
+    # already indexed under that backend.
+    own = set(KnowledgeFile.objects.filter(user=user, backend=backend).values_list("id", flat=True))
+    ids, docs = [], []
+    for cid, text, meta in zip(data.get("ids") or [], data.get("documents") or [], data.get("metadatas") or []):
+        meta = meta or {}
+        if meta.get("kb_file_id") is not None and meta["kb_file_id"] not in own:
+            continue
+        ids.append(cid)
+        docs.append(Document(page_content=text or "", metadata=meta))
+    lexical_index.delete_backend(user.id, backend)
+    lexical_index.add_chunks(user.id, backend, ids, docs)
+    return {"backend": backend, "chunks": len(ids)}
 
 @login_required
 @require_POST
@@ -85,35 +112,53 @@ def delete_knowledge_file(request):
     except KnowledgeFile.DoesNotExist:
         return JsonResponse({"error": "File not found"}, status=404)
 
-    backend = getattr(kf, "backend", "openai")
-
-    try:
-        if default_storage.exists(kf.file.name):
-            default_storage.delete(kf.file.name)
-    except Exception:
-        pass
+    backends = kf.backends
+    kf_id = kf.id
+    name = kf.file.name
+    original_name = kf.original_name
+    # Files ingested before chunks were tagged with kb_file_id can only be
+    # found by source, which is safe to filter on while no other file of the
+    # user's in that backend has the same name.
+    sole_source = not any(
+        backends[0] in other.backends
+        for other in KnowledgeFile.objects.filter(user=request.user, original_name=original_name).exclude(id=kf_id)
+    )
 
     kf.delete()
-
-    stats = _reindex_backend(request, backend)
-    return JsonResponse({"ok": True, "reindexed": stats})
-
-@login_required
-@require_POST
-def clear_knowledge(request):
-    qs = KnowledgeFile.objects.filter(user=request.user)
-    for kf in qs:
-        try:
-            if default_storage.exists(kf.file.name):
-                default_storage.delete(kf.file.name)
-        except Exception:
-            pass
+    release_file(name)
+
+    # With the retrieval daemon running, it owns the stores; let it delete.
+    result = retrieval_client.remote_delete_file_chunks(request.user.id, kf_id, backends, original_name, sole_source)
+    if result is None:
+        result = delete_file_chunks(request.user.id, kf_id, backends, original_name, sole_source)
+    removed, needs_rebuild = result
+    lexical_index.delete_file(request.user.id, kf_id)
+    # Legacy chunks shared with a same-named file: rebuild that backend once,
+    # in the ingest worker rather than in this request.
+    if needs_rebuild:
+        job = queue_reindex_backend(request.user, backends[0])
+        return JsonResponse({"ok": True, "reindex_job_id": job.id})
+
+    bump_kb_version(request.user.id)
+    return JsonResponse({"ok": True, "removed_chunks": removed})
+
+def wipe_knowledge(user):
+    qs = KnowledgeFile.objects.filter(user=user)
+    names = set(qs.values_list("file", flat=True))
     qs.delete()
+    for name in names:
+        release_file(name)
 
     for b in BACKENDS:
-        _delete_collection(request.user.id, b)
+        _delete_collection(user.id, b)
 
-    shutil.rmtree(user_chroma_dir(request.user.id), ignore_errors=True)
-    os.makedirs(user_chroma_dir(request.user.id), exist_ok=True)
+    invalidate_user(user.id, kinds=["chroma_clients", "vectorstores"])
+    shutil.rmtree(user_chroma_dir(user.id), ignore_errors=True)
+    os.makedirs(user_chroma_dir(user.id), exist_ok=True)
+    bump_kb_version(user.id)
 
+@login_required
+@require_POST
+def clear_knowledge(request):
+    wipe_knowledge(request.user)
     return JsonResponse({"ok": True})
@@ -0,0 +1,136 @@
+import math
+import re
+import sqlite3
+import unicodedata
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+from .rag_store import user_chroma_dir
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+    chunk_id UNINDEXED,
+    kb_file_id UNINDEXED,
+    backend UNINDEXED,
+    source UNINDEXED,
+    page UNINDEXED,
+    content,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# With OR-matching, function words would match nearly every chunk.
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "tell",
+    "that", "the", "this", "to", "was", "what", "when", "where", "which", "who",
+    "why", "with", "you", "about", "please",
+}
+
+
+def lexical_index_path(user_id: int) -> str:
+    return str(Path(user_chroma_dir(user_id)) / "lexical.sqlite3")
+
+
+def _connect(user_id: int):
+    conn = sqlite3.connect(lexical_index_path(user_id), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def add_chunks(user_id: int, backend: str, ids, docs):
+    rows = [
+        (cid, d.metadata.get("kb_file_id"), backend, d.metadata.get("source", ""),
+         d.metadata.get("page"), d.page_content)
+        for cid, d in zip(ids, docs)
+    ]
+    conn = _connect(user_id)
+    try:
+        with conn:
+            # FTS5 has no upsert, so clear the ids first to keep retries idempotent.
+            # Chunk ids repeat across backends, so the backend is part of the key.
+            conn.executemany("DELETE FROM chunks WHERE chunk_id = ? AND backend = ?", [(r[0], backend) for r in rows])
+            conn.executemany(
+                "INSERT INTO chunks (chunk_id, kb_file_id, backend, source, page, content) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+    finally:
+        conn.close()
+
+
+def delete_file(user_id: int, kf_id: int):
+    conn = _connect(user_id)
+    try:
+        with conn:
+            return conn.execute("DELETE FROM chunks WHERE kb_file_id = ?", (kf_id,)).rowcount
+    finally:
+        conn.close()
+
+
+def delete_backend(user_id: int, backend: str):
+    conn = _connect(user_id)
+    try:
+        with conn:
+            conn.execute("DELETE FROM chunks WHERE backend = ?", (backend,))
+    finally:
+        conn.close()
+
+
+def _fold(word: str) -> str:
+    # Lowercase without diacritics, as the unicode61 tokenizer indexes it.
+    return "".join(ch for ch in unicodedata.normalize("NFKD", word.lower()) if not unicodedata.combining(ch))
+
+
+def _terms(text: str):
+    return list(dict.fromkeys(_fold(w) for w in _WORD.findall(text) if w.lower() not in _STOPWORDS))
+
+
+def _fts_query(terms) -> str:
+    return " OR ".join(f'"{w}"' for w in terms)
+
+
+def search(user_id: int, query: str, k: int = 8, min_match: float = 0.0):
+    # min_match: fraction of the query's terms a chunk must contain. OR-matching
+    # alone lets one common word pull in unrelated chunks.
+    terms = _terms(query)
+    if not terms:
+        return []
+    need = max(1, math.ceil(min_match * len(terms)))
+    conn = _connect(user_id)
+    try:
+        rows = conn.execute(
+            "SELECT chunk_id, kb_file_id, backend, source, page, content, bm25(chunks) AS rank "
+            "FROM chunks WHERE chunks MATCH ? ORDER BY rank LIMIT ?",
+            (_fts_query(terms), k if need == 1 else k * 4),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+    out = []
+    for cid, kf_id, backend, source, page, content, rank in rows:
+        if need > 1:
+            words = {_fold(w) for w in _WORD.findall(content)}
+            if sum(t in words for t in terms) < need:
+                continue
+        if len(out) == k:
+            break
+        out.append(Document(
+            id=cid,
+            page_content=content,
+            metadata={
+                "source": source,
+                "page": page,
+                "kb_file_id": kf_id,
+                "kb_backend": backend,
+                # bm25() is lower-is-better; flip it so bigger means more relevant.
+                "bm25": -float(rank),
+            },
+        ))
+    return out
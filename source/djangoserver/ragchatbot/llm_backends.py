@@ -0,0 +1,42 @@
+from django.conf import settings
+
+from .crypto import decrypt_str
+from .pools import pooled
+
+def build_chat_llm(cfg):
+    provider = cfg.provider
+    model = cfg.model
+    temperature = cfg.temperature
+
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        api_key = decrypt_str(cfg.openai_api_key_enc)
+        if not api_key:
+            raise ValueError("OpenAI API key is missing. Add it in Settings.")
+        return ChatOpenAI(model=model, temperature=temperature, streaming=True, api_key=api_key)
+
+    if provider == "google":
+        api_key = decrypt_str(cfg.google_api_key_enc)
+        if not api_key:
+            raise ValueError("Google API key is missing. Add it in Settings.")
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=model, temperature=temperature, google_api_key=api_key, streaming=True)
+
+    if provider == "ollama":
+        from langchain_ollama import ChatOllama
+        return ChatOllama(
+            model=model,
+            temperature=temperature,
+            base_url=(cfg.ollama_base_url or "http://localhost:11434"),
+            streaming=True
+        )
+
+    if provider == "fake" and getattr(settings, "FAKE_PROVIDERS", False):
+        from .fake_providers import FakeStreamingChatModel
+        return FakeStreamingChatModel(model=model, token_delay_s=getattr(settings, "FAKE_TOKEN_DELAY_S", 0.02))
+
+    raise ValueError(f"Unknown provider: {provider}")
+
+def get_chat_llm(cfg):
+    key = (cfg.provider, cfg.model, cfg.temperature, cfg.updated_at)
+    return pooled(cfg.user_id, "llms", key, lambda: build_chat_llm(cfg))
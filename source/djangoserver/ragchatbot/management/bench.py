@@ -0,0 +1,30 @@
+import math
+
+# Helpers shared by the benchmark and stress-test management commands.
+
+
+def percentile(values, q):
+    # Nearest-rank percentile: the smallest value with at least q of the
+    # samples at or below it.
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * q) - 1)]
+
+
+def bench_user(username: str, marker: str, command: str):
+    # Accounts these commands create carry `marker` as their first_name and
+    # have no usable password. Any other existing account is refused, since
+    # the commands reset and delete its data.
+    from django.contrib.auth.models import User
+    from django.core.management.base import CommandError
+
+    user, created = User.objects.get_or_create(username=username, defaults={"first_name": marker})
+    if created:
+        user.set_unusable_password()
+        user.save()
+    elif user.first_name != marker or user.has_usable_password():
+        raise CommandError(
+            f"{username!r} is an existing account that {command} didn't create; pass an unused --username."
+        )
+    return user
@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ragchatbot.embedding_backends import get_embeddings_for_backend
+from ragchatbot.ingest_jobs import enqueue_backfill_job, run_ingest_job
+from ragchatbot.rag_store import BACKENDS
+
+
+class Command(BaseCommand):
+    help = "Embed a user's existing knowledge files into another backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("backend", choices=BACKENDS)
+        parser.add_argument("--now", action="store_true", help="Run here instead of queueing for the ingest worker")
+
+    def handle(self, *args, **opts):
+        try:
+            user = User.objects.get(username=opts["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {opts['username']}")
+
+        try:
+            get_embeddings_for_backend(user, opts["backend"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        job = enqueue_backfill_job(user, opts["backend"])
+        if job is None:
+            self.stdout.write(f"Every file is already in {opts['backend']}.")
+            return
+        if not opts["now"]:
+            self.stdout.write(f"Queued backfill job {job.id} ({job.files.count()} files).")
+            return
+
+        run_ingest_job(job)
+        job.refresh_from_db()
+        self.stdout.write(f"Backfill job {job.id}: {job.status} {job.error}".rstrip())
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ragchatbot.management.bench import bench_user, percentile
+
+BENCH_QUESTIONS = 40
+# first_name of accounts this command created. Any other account is refused,
+# since a run resets its provider and wipes its knowledge and chats.
+BENCH_MARKER = "bench_e2e"
+
+
+def _build_corpus(src: Path, dest: Path, copies: int):
+    # Each copy reshuffles the source pages and tags every paragraph, so no
+    # two files hash alike (uploads are deduplicated) and no chunk repeats.
+    from ragchatbot.ingest_pipeline import iter_file_docs
+
+    pages = []
+    for p in sorted(src.iterdir()):
+        if p.suffix.lower() in (".pdf", ".txt", ".md"):
+            pages.extend(d.page_content for d in iter_file_docs(str(p), p.name) if d.page_content.strip())
+    if not pages:
+        raise CommandError(f"No text found in {src}")
+
+    files = []
+    for c in range(copies):
+        order = pages[:]
+        random.Random(c).shuffle(order)
+        path = dest / f"corpus_{c:03d}.txt"
+        path.write_text("\n\n".join(f"[copy {c}] {p}" for p in order), encoding="utf-8")
+        files.append(path)
+    return pages, files
+
+
+class Command(BaseCommand):
+    help = "Offline end-to-end benchmark (ingest, retrieval, SSE time-to-first-token) with fake providers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", default="1,2,4,8", help="Comma-separated corpus copies of sample_docs")
+        parser.add_argument("--corpus", default=str(Path(settings.BASE_DIR).parent.parent / "sample_docs"))
+        parser.add_argument("--queries", type=int, default=BENCH_QUESTIONS)
+        parser.add_argument("--chats", type=int, default=10, help="Streamed chat turns per scale")
+        parser.add_argument("--username", default="bench")
+        parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **opts):
+        if not getattr(settings, "FAKE_PROVIDERS", False):
+            raise CommandError("Run with FAKE_PROVIDERS=1 so the fake embedding and chat providers are available.")
+
+        if opts["single"]:
+            self.stdout.write(json.dumps(self._run_scale(opts["single"], opts)))
+            return
+
+        bench_user(opts["username"], BENCH_MARKER, "bench_e2e")
+
+        self.stdout.write(
+            f"{'copies':>6} {'chunks':>7} {'ingest':>11} {'retr p50':>9} {'retr p99':>9} "
+            f"{'ttft p50':>9} {'ttft p99':>9} {'peak RSS':>9}"
+        )
+        manage = Path(settings.BASE_DIR) / "manage.py"
+        for scale in [int(s) for s in opts["scales"].split(",") if s.strip()]:
+            # One process per scale so peak RSS isn't carried over between rows.
+            cmd = [
+                sys.executable, str(manage), "bench_e2e", "--single", str(scale),
+                "--corpus", opts["corpus"], "--queries", str(opts["queries"]),
+                "--chats", str(opts["chats"]), "--username", opts["username"],
+            ]
+            out = subprocess.run(cmd, capture_output=True, text=True, env=os.environ.copy())
+            if out.returncode != 0:
+                raise CommandError(out.stderr.strip() or f"Scale {scale} failed")
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{scale:>6} {r['chunks']:>7} {r['chunks_per_s']:>7.0f} c/s "
+                f"{r['retrieve_ms_p50']:>7.1f}ms {r['retrieve_ms_p99']:>7.1f}ms "
+                f"{r['ttft_ms_p50']:>7.1f}ms {r['ttft_ms_p99']:>7.1f}ms {r['peak_rss_mb']:>7.0f}MB"
+            )
+
+    def _run_scale(self, scale: int, opts):
+        from django.core.files import File
+        from django.test import RequestFactory
+
+        from ragchatbot.blob_store import save_upload_blob
+        from ragchatbot.ingest_jobs import enqueue_ingest_job, run_ingest_job
+        from ragchatbot.knowledge_api import wipe_knowledge
+        from ragchatbot.models import Chat, IngestJobFile, KnowledgeFile, LLMSettings
+        from ragchatbot.multi_retriever import retrieve_merged
+        from ragchatbot.stream_api import chat_stream_api
+
+        user = bench_user(opts["username"], BENCH_MARKER, "bench_e2e")
+        LLMSettings.objects.update_or_create(user=user, defaults={"provider": "fake", "model": "fake-stream"})
+        wipe_knowledge(user)
+        Chat.objects.filter(user=user).delete()
+
+        tmp = Path(tempfile.mkdtemp(prefix="bench_e2e_"))
+        try:
+            pages, files = _build_corpus(Path(opts["corpus"]), tmp, scale)
+
+            kfs = []
+            for path in files:
+                with open(path, "rb") as fh, save_upload_blob(File(fh, name=path.name)) as (sha256, name):
+                    kfs.append(KnowledgeFile.objects.create(
+                        user=user, file=name, original_name=path.name,
+                        size_bytes=path.stat().st_size, backend="fake", sha256=sha256,
+                    ))
+            job = enqueue_ingest_job(user, "fake", kfs)
+            t0 = time.perf_counter()
+            run_ingest_job(job)
+            ingest_s = time.perf_counter() - t0
+            chunks = sum(IngestJobFile.objects.filter(job=job).values_list("chunks_embedded", flat=True))
+
+            rng = random.Random(0)
+            sentences = [s.strip() for p in pages for s in p.split(". ") if len(s.strip()) > 40]
+            questions = rng.sample(sentences, min(opts["queries"], len(sentences)))
+
+            retrieve_ms = []
+            for q in questions:
+                t0 = time.perf_counter()
+                retrieve_merged(user, q, k_per_backend=3, k_total=4, max_distance=0.55)
+                retrieve_ms.append((time.perf_counter() - t0) * 1000)
+
+            factory = RequestFactory()
+            ttft_ms = []
+            for q in questions[:opts["chats"]]:
+                request = factory.post("/api/chat/stream/", data=json.dumps({"message": q}),
+                                       content_type="application/json")
+                request.user = user
+                t0 = time.perf_counter()
+                first = None
+                for part in chat_stream_api(request).streaming_content:
+                    if first is None and part.startswith(b"event: token"):
+                        first = time.perf_counter()
+                if first is not None:
+                    ttft_ms.append((first - t0) * 1000)
+
+            return {
+                "chunks": chunks,
+                "chunks_per_s": chunks / ingest_s if ingest_s else 0.0,
+                "retrieve_ms_p50": statistics.median(retrieve_ms) if retrieve_ms else 0.0,
+                "retrieve_ms_p99": percentile(retrieve_ms, 0.99),
+                "ttft_ms_p50": statistics.median(ttft_ms) if ttft_ms else 0.0,
+                "ttft_ms_p99": percentile(ttft_ms, 0.99),
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+        finally:
+            wipe_knowledge(user)
+            Chat.objects.filter(user=user).delete()
+            shutil.rmtree(tmp, ignore_errors=True)
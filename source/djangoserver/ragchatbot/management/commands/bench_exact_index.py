@@ -0,0 +1,83 @@
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ragchatbot.management.bench import percentile
+
+COLLECTION = "kb_bench_v1"
+
+
+class Command(BaseCommand):
+    help = "Compare exact in-memory search with Chroma HNSW across collection sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="500,1000,2000,5000,10000,20000,50000",
+                            help="Comma-separated chunk counts")
+        parser.add_argument("--dim", type=int, default=768)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=8)
+
+    def handle(self, *args, **opts):
+        import numpy as np
+        from chromadb import PersistentClient
+
+        from ragchatbot.exact_index import ExactIndex
+
+        dim, k = opts["dim"], opts["k"]
+        rng = np.random.default_rng(0)
+        self.stdout.write(
+            f"{'chunks':>7} {'exact load':>11} {'exact p50':>10} {'exact p99':>10} "
+            f"{'hnsw open':>10} {'hnsw p50':>9} {'hnsw p99':>9} {'recall':>7}"
+        )
+
+        for n in [int(s) for s in opts["sizes"].split(",") if s.strip()]:
+            root = tempfile.mkdtemp(prefix="bench_exact_")
+            try:
+                m = rng.standard_normal((n, dim)).astype(np.float32)
+                ids = [f"c{i}" for i in range(n)]
+                docs = [f"chunk {i}" for i in range(n)]
+                metas = [{"i": i} for i in range(n)]
+
+                col = PersistentClient(path=str(Path(root) / "chroma")).get_or_create_collection(
+                    COLLECTION, metadata={"hnsw:space": "cosine"}
+                )
+                for s in range(0, n, 5000):
+                    col.upsert(ids=ids[s:s + 5000], embeddings=m[s:s + 5000].tolist(),
+                               documents=docs[s:s + 5000], metadatas=metas[s:s + 5000])
+                ExactIndex(str(Path(root) / "exact")).build("bench", ids, m, docs, metas)
+
+                # Cold opens: what a request pays when nothing is pooled yet.
+                t0 = time.perf_counter()
+                exact = ExactIndex(str(Path(root) / "exact"))
+                exact._load("bench")
+                load_ms = (time.perf_counter() - t0) * 1000
+
+                t0 = time.perf_counter()
+                col = PersistentClient(path=str(Path(root) / "chroma")).get_collection(COLLECTION)
+                col.query(query_embeddings=[m[0].tolist()], n_results=k)
+                open_ms = (time.perf_counter() - t0) * 1000
+
+                queries = rng.standard_normal((opts["queries"], dim)).astype(np.float32)
+                exact_ms, hnsw_ms, recall = [], [], []
+                for q in queries:
+                    t0 = time.perf_counter()
+                    truth = {d.id for d, _dist, _vec in exact.search(q, k)}
+                    exact_ms.append((time.perf_counter() - t0) * 1000)
+
+                    t0 = time.perf_counter()
+                    res = col.query(query_embeddings=[q.tolist()], n_results=k)
+                    hnsw_ms.append((time.perf_counter() - t0) * 1000)
+                    recall.append(len(truth & set(res["ids"][0])) / k)
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+
+            self.stdout.write(
+                f"{n:>7} {load_ms:>9.1f}ms {statistics.median(exact_ms):>8.2f}ms {percentile(exact_ms, 0.99):>8.2f}ms "
+                f"{open_ms:>8.1f}ms {statistics.median(hnsw_ms):>7.2f}ms {percentile(hnsw_ms, 0.99):>7.2f}ms "
+                f"{statistics.mean(recall):>7.3f}"
+            )
+        self.stdout.write("Set EXACT_INDEX_MAX_CHUNKS near the size where exact p99 overtakes hnsw p99.")
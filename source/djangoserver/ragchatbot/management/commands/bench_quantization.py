@@ -0,0 +1,95 @@
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from ragchatbot.rag_store import BACKENDS
+
+
+class Command(BaseCommand):
+    help = "Report recall@k and index size for float32, float16 and int8 vector storage on a local corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User whose embedding settings are used")
+        parser.add_argument("--backend", choices=BACKENDS, default="openai")
+        parser.add_argument("--corpus", default=str(Path(settings.BASE_DIR).parent.parent / "sample_docs"))
+        parser.add_argument("--k", type=int, default=8)
+        parser.add_argument("--queries", type=int, default=50)
+
+    def handle(self, *args, **opts):
+        import numpy as np
+
+        from ragchatbot.embedding_backends import get_embeddings_for_backend
+        from ragchatbot.exact_index import QUANTIZATIONS, ExactIndex, approx_scores
+        from ragchatbot.ingest_pipeline import load_file_to_docs
+
+        try:
+            user = User.objects.get(username=opts["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {opts['username']}")
+
+        files = [p for p in sorted(Path(opts["corpus"]).iterdir()) if p.suffix.lower() in (".pdf", ".txt", ".md")]
+        if not files:
+            raise CommandError(f"No .pdf/.txt/.md files in {opts['corpus']}")
+
+        splitter = RecursiveCharacterTextSplitter(chunk_size=900, chunk_overlap=120)
+        chunks = []
+        for p in files:
+            chunks.extend(splitter.split_documents(load_file_to_docs(str(p), p.name)))
+        texts = [c.page_content for c in chunks]
+
+        # Queries are single sentences taken from the corpus, embedded as queries.
+        rng = random.Random(0)
+        sentences = [s.strip() for t in texts for s in t.split(". ") if len(s.strip()) > 40]
+        questions = rng.sample(sentences, min(opts["queries"], len(sentences)))
+
+        emb = get_embeddings_for_backend(user, opts["backend"])
+        vectors = np.asarray(emb.embed_documents(texts), dtype=np.float32)
+        queries = [np.asarray(emb.embed_query(q), dtype=np.float32) for q in questions]
+        ids = [f"c{i}" for i in range(len(texts))]
+        k = min(opts["k"], len(ids))
+        self.stdout.write(f"{len(ids)} chunks, dim {vectors.shape[1]}, {len(queries)} queries, k={k}")
+
+        root = tempfile.mkdtemp(prefix="bench_quant_")
+        try:
+            truth = []
+            header = f"{'mode':<8} {'index MB':>8} {'B/vector':>9} {'recall@k raw':>13} {'recall@k rescored':>18} {'p50':>8}"
+            self.stdout.write(header)
+            for mode in QUANTIZATIONS:
+                index = ExactIndex(str(Path(root) / mode), quantization=mode)
+                index.build("bench", ids, vectors, texts, [{} for _ in ids])
+                scan = index.codes if index.codes is not None else index.matrix
+                scan_bytes = scan.nbytes + (index.scales.nbytes if index.scales is not None else 0)
+                # Stands in for the float32 rows the live index reads back from Chroma.
+                fetch = lambda sel: vectors[[int(i[1:]) for i in sel]]  # noqa: E731
+
+                raw, rescored, ms = [], [], []
+                for qi, q in enumerate(queries):
+                    t0 = time.perf_counter()
+                    hits = [d.id for d, _dist, _vec in index.search(q, k, fetch=fetch)]
+                    ms.append((time.perf_counter() - t0) * 1000)
+                    if mode == "none":
+                        truth.append(set(hits))
+                        raw.append(1.0)
+                        rescored.append(1.0)
+                        continue
+                    qn = q / max(float(np.linalg.norm(q)), 1e-12)
+                    approx = approx_scores(index.codes, index.scales, qn)
+                    raw_ids = {ids[i] for i in np.argsort(-approx)[:k]}
+                    raw.append(len(raw_ids & truth[qi]) / k)
+                    rescored.append(len(set(hits) & truth[qi]) / k)
+
+                self.stdout.write(
+                    f"{mode:<8} {scan_bytes / 1e6:>8.2f} {scan_bytes / len(ids):>9.0f} "
+                    f"{statistics.mean(raw):>13.3f} {statistics.mean(rescored):>18.3f} "
+                    f"{statistics.median(ms):>6.2f}ms"
+                )
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,103 @@
+import multiprocessing
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ragchatbot.management.bench import percentile
+
+COLLECTION = "kb_bench_v1"
+
+
+def _random_unit(rng, n, dim):
+    import numpy as np
+    m = rng.standard_normal((n, dim)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+def _populate(root: str, layout: str, users: int, chunks: int, dim: int):
+    import numpy as np
+    from chromadb import PersistentClient
+
+    rng = np.random.default_rng(0)
+    shared = PersistentClient(path=str(Path(root) / "shared")) if layout == "shared" else None
+    for uid in range(users):
+        client = shared or PersistentClient(path=str(Path(root) / f"user_{uid}"))
+        col = client.get_or_create_collection(COLLECTION, metadata={"hnsw:space": "cosine"})
+        vecs = _random_unit(rng, chunks, dim)
+        col.upsert(
+            ids=[f"u{uid}_{i}" for i in range(chunks)],
+            embeddings=vecs.tolist(),
+            documents=[f"user {uid} chunk {i}" for i in range(chunks)],
+            metadatas=[{"user_id": uid} for _ in range(chunks)],
+        )
+
+
+def _measure(root: str, layout: str, users: int, dim: int, queries: int, out):
+    # Runs in a fresh process so client opens are cold and RSS is comparable.
+    import numpy as np
+    from chromadb import PersistentClient
+
+    rng = np.random.default_rng(1)
+    open_ms, query_ms = [], []
+    shared_col = None
+
+    for q in range(queries):
+        uid = int(rng.integers(users))
+        t0 = time.perf_counter()
+        if layout == "shared":
+            if shared_col is None:
+                shared_col = PersistentClient(path=str(Path(root) / "shared")).get_collection(COLLECTION)
+            col, where = shared_col, {"user_id": uid}
+        else:
+            col, where = PersistentClient(path=str(Path(root) / f"user_{uid}")).get_collection(COLLECTION), None
+        t1 = time.perf_counter()
+        col.query(query_embeddings=_random_unit(rng, 1, dim).tolist(), n_results=4, where=where)
+        t2 = time.perf_counter()
+        open_ms.append((t1 - t0) * 1000)
+        query_ms.append((t2 - t1) * 1000)
+
+    out.put({
+        "open_ms_p50": statistics.median(open_ms),
+        "open_ms_max": max(open_ms),
+        "query_ms_p50": statistics.median(query_ms),
+        "query_ms_p99": percentile(query_ms, 0.99),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+class Command(BaseCommand):
+    help = "Compare the per-user and shared Chroma layouts on synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", default="10,100,1000", help="Comma-separated user counts")
+        parser.add_argument("--chunks", type=int, default=50, help="Chunks per user")
+        parser.add_argument("--dim", type=int, default=384)
+        parser.add_argument("--queries", type=int, default=200)
+
+    def handle(self, *args, **opts):
+        ctx = multiprocessing.get_context("spawn")
+        header = f"{'layout':<9} {'users':>6} {'open p50':>9} {'open max':>9} {'query p50':>10} {'query p99':>10} {'peak RSS':>9}"
+        self.stdout.write(header)
+
+        for users in [int(u) for u in opts["users"].split(",") if u.strip()]:
+            for layout in ("per_user", "shared"):
+                root = tempfile.mkdtemp(prefix="bench_vs_")
+                try:
+                    _populate(root, layout, users, opts["chunks"], opts["dim"])
+                    out = ctx.Queue()
+                    p = ctx.Process(target=_measure, args=(root, layout, users, opts["dim"], opts["queries"], out))
+                    p.start()
+                    r = out.get()
+                    p.join()
+                finally:
+                    shutil.rmtree(root, ignore_errors=True)
+
+                self.stdout.write(
+                    f"{layout:<9} {users:>6} {r['open_ms_p50']:>7.2f}ms {r['open_ms_max']:>7.1f}ms "
+                    f"{r['query_ms_p50']:>8.2f}ms {r['query_ms_p99']:>8.2f}ms {r['peak_rss_mb']:>7.0f}MB"
+                )
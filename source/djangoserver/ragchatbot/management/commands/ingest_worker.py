@@ -0,0 +1,53 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ragchatbot.ingest_jobs import worker_loop
+
+
+def _run_worker(poll_interval, stop):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_loop(poll_interval=poll_interval, stop=stop)
+
+
+class Command(BaseCommand):
+    help = "Run background ingestion workers that pull queued upload jobs from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+
+    def handle(self, *args, **opts):
+        n = max(1, opts["processes"])
+        poll = opts["poll_interval"]
+
+        if n == 1:
+            self.stdout.write("Ingest worker started (1 process)")
+            worker_loop(poll_interval=poll)
+            return
+
+        # Children must open their own DB connections. They are not daemonic
+        # so they can start the PDF parse pool; shutdown goes through `stop`.
+        connections.close_all()
+        stop = multiprocessing.Event()
+        procs = [
+            multiprocessing.Process(target=_run_worker, args=(poll, stop), daemon=False)
+            for _ in range(n)
+        ]
+        for p in procs:
+            p.start()
+        self.stdout.write(f"Ingest worker started ({n} processes)")
+
+        def _shutdown(*_):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, _shutdown)
+        try:
+            for p in procs:
+                p.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for p in procs:
+                p.join()
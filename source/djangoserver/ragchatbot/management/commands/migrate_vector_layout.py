@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from langchain_core.documents import Document
+
+from ragchatbot.rag_store import (
+    BACKENDS,
+    build_vectorstore,
+    collection_name_for_backend,
+    get_chroma_client,
+    get_shared_chroma_client,
+    invalidate_exact_index,
+)
+from ragchatbot.pools import invalidate_user
+
+LAYOUTS = ["per_user", "shared"]
+
+
+class Command(BaseCommand):
+    help = "Copy stored vectors between the per-user and shared Chroma layouts without re-embedding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=LAYOUTS, required=True, dest="target")
+        parser.add_argument("--user", help="Only migrate this username")
+        parser.add_argument("--batch", type=int, default=500)
+        parser.add_argument("--delete-source", action="store_true", help="Remove vectors from the old layout afterwards")
+
+    def _source_has_collection(self, layout, user_id, backend):
+        client = get_shared_chroma_client() if layout == "shared" else get_chroma_client(user_id)
+        return collection_name_for_backend(backend) in {c.name for c in client.list_collections()}
+
+    def handle(self, *args, **opts):
+        target = opts["target"]
+        source = "shared" if target == "per_user" else "per_user"
+
+        users = User.objects.all()
+        if opts["user"]:
+            users = users.filter(username=opts["user"])
+            if not users.exists():
+                raise CommandError(f"Unknown user: {opts['user']}")
+
+        for user in users.iterator():
+            for backend in BACKENDS:
+                if not self._source_has_collection(source, user.id, backend):
+                    continue
+                src = build_vectorstore(source, user.id, backend, None)
+                dst = build_vectorstore(target, user.id, backend, None)
+
+                copied, offset = 0, 0
+                while True:
+                    page = src.get(include=["embeddings", "documents", "metadatas"], limit=opts["batch"], offset=offset)
+                    ids = page.get("ids") or []
+                    if not ids:
+                        break
+                    docs = []
+                    for text, meta in zip(page["documents"], page["metadatas"]):
+                        meta = dict(meta or {})
+                        meta["user_id"] = user.id
+                        docs.append(Document(page_content=text or "", metadata=meta))
+                    dst.upsert(ids, page["embeddings"], docs)
+                    copied += len(ids)
+                    offset += len(ids)
+
+                if opts["delete_source"] and copied:
+                    src.delete_all()
+                    invalidate_exact_index(source, user.id, backend)
+                if copied:
+                    invalidate_exact_index(target, user.id, backend)
+                if copied:
+                    self.stdout.write(f"{user.username}/{backend}: {copied} vectors -> {target}")
+
+            invalidate_user(user.id, kinds=["vectorstores"])
+
+        self.stdout.write(f"Done. Set VECTOR_STORE_LAYOUT={target} to serve from the new layout.")
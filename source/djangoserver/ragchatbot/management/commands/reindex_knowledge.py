@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ragchatbot.knowledge_api import BACKENDS, reindex_backend, rebuild_lexical_index
+from ragchatbot.models import KnowledgeFile
+
+
+class Command(BaseCommand):
+    help = "Drop and fully re-embed a user's knowledge base collections."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--backend", choices=BACKENDS, help="Only rebuild this backend")
+        parser.add_argument(
+            "--lexical-only", action="store_true",
+            help="Only rebuild the keyword index from stored chunks (no re-embedding)",
+        )
+
+    def handle(self, *args, **opts):
+        try:
+            user = User.objects.get(username=opts["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {opts['username']}")
+
+        if opts["backend"]:
+            backends = [opts["backend"]]
+        else:
+            backends = sorted({b for kf in KnowledgeFile.objects.filter(user=user) for b in kf.backends})
+
+        for b in backends:
+            if opts["lexical_only"]:
+                stats = rebuild_lexical_index(user, b)
+                self.stdout.write(f"{b}: {stats['chunks']} chunks indexed for keyword search")
+                continue
+            stats = reindex_backend(user, b)
+            self.stdout.write(f"{b}: {stats['files']} files, {stats['chunks']} chunks")
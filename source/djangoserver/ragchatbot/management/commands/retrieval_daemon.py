@@ -0,0 +1,48 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ragchatbot.retrieval_daemon import serve
+
+
+class Command(BaseCommand):
+    help = "Serve retrieval for every web worker on this host over a Unix socket."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=getattr(settings, "RETRIEVAL_DAEMON_SOCKET", ""))
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent retrievals")
+        parser.add_argument(
+            "--ingest", action="store_true",
+            help="Also run the ingest worker here, so reads and writes share one set of stores",
+        )
+        parser.add_argument("--ingest-threads", type=int, default=1, help="Concurrent ingest jobs with --ingest")
+
+    def handle(self, *args, **opts):
+        path = opts["socket"]
+        if not path:
+            raise CommandError("Set RETRIEVAL_DAEMON_SOCKET or pass --socket.")
+
+        server = serve(path, threads=max(1, opts["threads"]))
+        stop = threading.Event()
+
+        if opts["ingest"]:
+            from ragchatbot.ingest_jobs import worker_loop
+            for i in range(max(1, opts["ingest_threads"])):
+                threading.Thread(
+                    target=worker_loop, kwargs={"stop": stop}, name=f"daemon-ingest-{i}", daemon=True,
+                ).start()
+
+        def _shutdown(*_):
+            stop.set()
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, _shutdown)
+        self.stdout.write(f"Retrieval daemon listening on {path}" + (" (with ingest worker)" if opts["ingest"] else ""))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            stop.set()
+        finally:
+            server.server_close()
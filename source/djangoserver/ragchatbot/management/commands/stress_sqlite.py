@@ -0,0 +1,113 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from ragchatbot.management.bench import bench_user
+
+# first_name of accounts this command created; each round deletes the
+# account's stress chats and files, so no other account is used.
+STRESS_MARKER = "stress_sqlite"
+
+
+class Command(BaseCommand):
+    help = "Run N parallel simulated chat streams (plus uploads) against the database and report write throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--streams", default="1,4,16,32", help="Comma-separated parallel stream counts")
+        parser.add_argument("--tokens", type=int, default=200, help="Tokens per simulated answer")
+        parser.add_argument("--checkpoint-every", type=int, default=20, help="Tokens between partial saves")
+        parser.add_argument("--uploaders", type=int, default=2, help="Threads inserting KnowledgeFile rows")
+        parser.add_argument("--username", default="stress")
+
+    def handle(self, *args, **opts):
+        from ragchatbot.db_tuning import lock_stats, retry_on_lock
+        from ragchatbot.models import Chat, KnowledgeFile
+        from ragchatbot.stream_api import AnswerCheckpoint
+
+        user = bench_user(opts["username"], STRESS_MARKER, "stress_sqlite")
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            mode = cursor.fetchone()[0]
+        self.stdout.write(f"journal_mode={mode}")
+        self.stdout.write(
+            f"{'streams':>7} {'writes':>7} {'writes/s':>9} {'stream p50':>11} {'stream max':>11} "
+            f"{'retries':>8} {'errors':>7}"
+        )
+
+        for n in [int(s) for s in opts["streams"].split(",") if s.strip()]:
+            before = lock_stats()
+            errors, durations, writes = [], [], [0]
+            lock = threading.Lock()
+            stop = threading.Event()
+
+            def stream(i):
+                # Same write pattern as chat_stream_api: user message, title
+                # save, periodic partial checkpoints, final save.
+                t0 = time.perf_counter()
+                count = 0
+                try:
+                    chat = retry_on_lock(Chat.objects.create, user=user, title=f"stress {i}")
+                    retry_on_lock(chat.messages.create, role="user", content="question")
+                    retry_on_lock(chat.save, update_fields=["updated_at"])
+                    count += 3
+                    checkpoint = AnswerCheckpoint(chat, 0)
+                    text = ""
+                    for t in range(opts["tokens"]):
+                        text += f" tok{t}"
+                        if t % opts["checkpoint_every"] == 0:
+                            checkpoint.save(text)
+                            count += 1
+                    checkpoint.save(text, partial=False)
+                    retry_on_lock(chat.save, update_fields=["updated_at"])
+                    count += 2
+                except OperationalError as e:
+                    with lock:
+                        errors.append(str(e))
+                finally:
+                    connections.close_all()
+                with lock:
+                    writes[0] += count
+                    durations.append(time.perf_counter() - t0)
+
+            def uploader(i):
+                j = 0
+                try:
+                    while not stop.is_set():
+                        retry_on_lock(
+                            KnowledgeFile.objects.create,
+                            user=user, file=f"stress/{i}_{j}.txt", original_name="stress.txt", backend="stress",
+                        )
+                        j += 1
+                        with lock:
+                            writes[0] += 1
+                except OperationalError as e:
+                    with lock:
+                        errors.append(str(e))
+                finally:
+                    connections.close_all()
+
+            uploaders = [threading.Thread(target=uploader, args=(i,)) for i in range(opts["uploaders"])]
+            streams = [threading.Thread(target=stream, args=(i,)) for i in range(n)]
+            t0 = time.perf_counter()
+            for t in uploaders + streams:
+                t.start()
+            for t in streams:
+                t.join()
+            stop.set()
+            for t in uploaders:
+                t.join()
+            elapsed = time.perf_counter() - t0
+
+            after = lock_stats()
+            self.stdout.write(
+                f"{n:>7} {writes[0]:>7} {writes[0] / elapsed:>9.0f} "
+                f"{statistics.median(durations) * 1000:>9.0f}ms {max(durations) * 1000:>9.0f}ms "
+                f"{after['retries'] - before['retries']:>8} {len(errors):>7}"
+            )
+
+            Chat.objects.filter(user=user, title__startswith="stress ").delete()
+            KnowledgeFile.objects.filter(user=user, backend="stress").delete()
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Latency histograms per (pipeline, stage), rendered in the Prometheus text
+# format by metrics_api. Every process that records them (web workers, ingest
+# workers, the retrieval daemon) writes a snapshot to METRICS_DIR every
+# DUMP_INTERVAL_S, and /metrics renders the sum of those files, so any web
+# worker answers a scrape with the same host-wide numbers. Snapshots of
+# processes that have exited are pruned, which shows up as a counter reset.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DUMP_INTERVAL_S = 15.0
+# A snapshot not rewritten for this long belongs to a dead process.
+SNAPSHOT_TTL_S = DUMP_INTERVAL_S * 8
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+_hists = {}
+_lock = threading.Lock()
+_dumper_pid = None
+
+def _ensure_dumper():
+    # Started lazily, and again after a fork: threads don't survive one.
+    global _dumper_pid
+    if _dumper_pid == os.getpid():
+        return
+    _dumper_pid = os.getpid()
+    threading.Thread(target=_dump_loop, name="metrics-dump", daemon=True).start()
+
+def _dump_loop():
+    pid = os.getpid()
+    while _dumper_pid == pid:
+        time.sleep(DUMP_INTERVAL_S)
+        try:
+            dump_process_metrics()
+        except OSError:
+            logger.exception("Could not write metrics snapshot")
+
+def observe(pipeline: str, stage: str, seconds: float, timings=None):
+    _ensure_dumper()
+    with _lock:
+        h = _hists.get((pipeline, stage))
+        if h is None:
+            h = _hists[(pipeline, stage)] = Histogram()
+        h.observe(seconds)
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 1)
+
+@contextmanager
+def span(pipeline: str, stage: str, timings=None):
+    # timings: optional dict collecting milliseconds per stage for one request.
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(pipeline, stage, time.perf_counter() - t0, timings)
+
+def _metrics_dir() -> Path:
+    return Path(getattr(settings, "METRICS_DIR", Path(settings.BASE_DIR) / "metrics"))
+
+def _snapshot():
+    with _lock:
+        return {k: (list(h.counts), h.sum, h.count) for k, h in _hists.items()}
+
+def _snapshot_path(d: Path, pid: int) -> Path:
+    return d / f"proc-{pid}.json"
+
+def dump_process_metrics():
+    # Counters are cumulative per process, so each process owns one file.
+    d = _metrics_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    rows = [[pipeline, stage, counts, total, count] for (pipeline, stage), (counts, total, count) in _snapshot().items()]
+    tmp = d / f".proc-{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(rows))
+    os.replace(tmp, _snapshot_path(d, os.getpid()))
+
+def _pid_alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _stale(path: Path) -> bool:
+    try:
+        age = time.time() - path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    if age > SNAPSHOT_TTL_S:
+        return True
+    try:
+        pid = int(path.stem.split("-", 1)[1])
+    except (IndexError, ValueError):
+        return True
+    return not _pid_alive(pid)
+
+def _merged_snapshot():
+    dump_process_metrics()
+    merged = {}
+    for path in _metrics_dir().glob("proc-*.json"):
+        if _stale(path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            continue
+        try:
+            rows = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for pipeline, stage, counts, total, count in rows:
+            if len(counts) != len(BUCKETS):
+                continue
+            have = merged.get((pipeline, stage))
+            if have is None:
+                merged[(pipeline, stage)] = (list(counts), total, count)
+            else:
+                merged[(pipeline, stage)] = ([a + b for a, b in zip(have[0], counts)], have[1] + total, have[2] + count)
+    return merged
+
+def _labels(**kv):
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in kv.items()) + "}"
+
+def render_prometheus() -> str:
+    from .db_tuning import lock_stats
+    from .embedding_cache import get_embedding_cache
+    from .pools import pool_stats
+    from .query_cache import get_query_cache
+
+    lines = [
+        "# HELP ragchatbot_stage_seconds Time spent in each pipeline stage.",
+        "# TYPE ragchatbot_stage_seconds histogram",
+    ]
+    for (pipeline, stage), (counts, total, count) in sorted(_merged_snapshot().items()):
+        cumulative = 0
+        for le, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append(f"ragchatbot_stage_seconds_bucket{_labels(pipeline=pipeline, stage=stage, le=le)} {cumulative}")
+        lines.append(f"ragchatbot_stage_seconds_bucket{_labels(pipeline=pipeline, stage=stage, le='+Inf')} {count}")
+        lines.append(f"ragchatbot_stage_seconds_sum{_labels(pipeline=pipeline, stage=stage)} {total:.6f}")
+        lines.append(f"ragchatbot_stage_seconds_count{_labels(pipeline=pipeline, stage=stage)} {count}")
+
+    # The cache, lock and pool figures below are this worker's own.
+    q = get_query_cache().stats()
+    lines += [
+        "# TYPE ragchatbot_query_embed_cache_hits_total counter",
+        f"ragchatbot_query_embed_cache_hits_total {q['hits']}",
+        "# TYPE ragchatbot_query_embed_cache_misses_total counter",
+        f"ragchatbot_query_embed_cache_misses_total {q['misses']}",
+    ]
+
+    emb = get_embedding_cache().stats()
+    lines.append("# TYPE ragchatbot_embed_cache_hits_total counter")
+    lines += [f"ragchatbot_embed_cache_hits_total{_labels(ns=ns)} {v['hits']}" for ns, v in emb.items()]
+    lines.append("# TYPE ragchatbot_embed_cache_misses_total counter")
+    lines += [f"ragchatbot_embed_cache_misses_total{_labels(ns=ns)} {v['misses']}" for ns, v in emb.items()]
+
+    locks = lock_stats()
+    lines += [
+        "# TYPE ragchatbot_db_lock_retries_total counter",
+        f"ragchatbot_db_lock_retries_total {locks['retries']}",
+        "# TYPE ragchatbot_db_lock_failures_total counter",
+        f"ragchatbot_db_lock_failures_total {locks['failures']}",
+    ]
+
+    lines.append("# TYPE ragchatbot_pooled_objects gauge")
+    lines += [f"ragchatbot_pooled_objects{_labels(kind=k)} {v}" for k, v in pool_stats().items()]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,17 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from .metrics import render_prometheus
+
+def metrics_api(request):
+    # Staff sessions, or a scraper sending "Authorization: Bearer <METRICS_TOKEN>".
+    token = getattr(settings, "METRICS_TOKEN", "")
+    auth = request.headers.get("Authorization", "")
+    allowed = request.user.is_authenticated and request.user.is_staff
+    if token and auth.startswith("Bearer ") and hmac.compare_digest(auth[7:], token):
+        allowed = True
+    if not allowed:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -21,8 +21,19 @@ class KnowledgeFile(models.Model):
     original_name = models.CharField(max_length=255)
     size_bytes = models.BigIntegerField(default=0)
     backend = models.CharField(max_length=32, default="openai") 
+    # Other backends this file was also embedded into (fan-out or backfill).
+    extra_backends = models.JSONField(default=list, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "backend", "sha256"], name="kfile_user_backend_sha_idx"),
+        ]
+
+    @property
+    def backends(self):
+        return [self.backend] + [b for b in (self.extra_backends or []) if b != self.backend]
 
     def __str__(self):
         return f"{self.user.username}: {self.original_name}"
@@ -31,12 +42,61 @@ class KnowledgeFile(models.Model):
 class Chat(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chats")
     title = models.CharField(max_length=120, default="New chat")
+    # Rolling summary of every message with id <= summary_upto.
+    summary = models.TextField(blank=True, default="")
+    summary_upto = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-updated_at", "-id"], name="chat_user_updated_idx"),
+        ]
+
 class Message(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="messages")
     role = models.CharField(max_length=16)  
     content = models.TextField(default="")
     is_partial = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["chat", "created_at", "id"], name="message_chat_created_idx"),
+        ]
+
+class IngestJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="ingest_jobs")
+    backend = models.CharField(max_length=32, default="openai")
+    # Fan-out: backends embedded alongside `backend` in the same parse pass.
+    extra_backends = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued", db_index=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class IngestJobFile(models.Model):
+    job = models.ForeignKey(IngestJob, on_delete=models.CASCADE, related_name="files")
+    knowledge_file = models.ForeignKey(KnowledgeFile, on_delete=models.SET_NULL, null=True, related_name="ingest_jobs")
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, default="queued")
+    pages_parsed = models.IntegerField(default=0)
+    chunks_total = models.IntegerField(default=0)
+    chunks_embedded = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+
+class KnowledgeVersion(models.Model):
+    # Bumped whenever a user's indexed knowledge changes, so caches keyed
+    # on it go stale across every worker process.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="knowledge_version")
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
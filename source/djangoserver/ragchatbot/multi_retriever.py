@@ -1,49 +1,189 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
 from langchain_core.documents import Document
 from .embedding_backends import get_embeddings_for_backend
-from .rag_store import get_vectorstore_for_backend, collection_name_for_backend
-from .models import LLMSettings
-from chromadb import PersistentClient
-from .rag_store import user_chroma_dir
+from .rag_store import get_vectorstore_for_backend, list_backends_with_data, query_with_vectors
+from .models import KnowledgeFile, LLMSettings
+from .rerank import Candidate, RERANKER, RERANK_POOL, normalize_per_backend, rerank
+from .pools import invalidate_user
+from .query_cache import embed_query_cached, get_query_cache
+from .metrics import observe, span
+from . import retrieval_client
+from . import lexical_index
 
-BACKENDS = ["openai", "google", "ollama"]
+RETRIEVE_TIMEOUT_S = getattr(settings, "RETRIEVE_TIMEOUT_S", 4.0)
+# "hybrid" (vector + BM25 fused), "vector" or "lexical".
+RETRIEVAL_MODE = getattr(settings, "RETRIEVAL_MODE", "hybrid")
+RRF_K = 60
+# Fraction of the query's terms a keyword hit must contain to be used.
+LEXICAL_MIN_MATCH = getattr(settings, "LEXICAL_MIN_MATCH", 0.5)
 
 def list_existing_backends(user_id: int):
-    client = PersistentClient(path=user_chroma_dir(user_id))
-    existing = {c.name for c in client.list_collections()}
+    return list_backends_with_data(user_id)
+
+def backends_to_search(user, existing):
+    # Once one backend holds every file (fan-out, or a finished backfill),
+    # searching it alone covers the whole knowledge base with one remote call.
+    if len(existing) < 2:
+        return existing
+    provider = LLMSettings.objects.filter(user=user).values_list("provider", flat=True).first()
+    if provider not in existing:
+        return existing
+    for backend, extra in KnowledgeFile.objects.filter(user=user).values_list("backend", "extra_backends"):
+        if backend != provider and provider not in (extra or []):
+            return existing
+    return [provider]
+
+# One small pool per backend: a search that overruns its budget keeps its
+# thread until the remote call returns (bounded by EMBED_REQUEST_TIMEOUT_S),
+# so a hung backend can only tie up its own threads.
+RETRIEVE_THREADS_PER_BACKEND = 4
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _executor_for(backend: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        ex = _executors.get(backend)
+        if ex is None:
+            ex = _executors[backend] = ThreadPoolExecutor(
+                max_workers=RETRIEVE_THREADS_PER_BACKEND, thread_name_prefix=f"retrieve-{backend}"
+            )
+        return ex
+
+def _search_backend(vs, backend: str, query: str, k: int, max_distance):
+    t0 = time.perf_counter()
     out = []
-    for b in BACKENDS:
-        if collection_name_for_backend(b) in existing:
-            out.append(b)
-    return out
+    with span("retrieve", "embed_query"):
+        qvec, cached = embed_query_cached(vs.embeddings, backend, query)
+    with span("retrieve", "vector_search"):
+        hits = query_with_vectors(vs, qvec, k)
+    for d, dist, vec in hits:
+        if max_distance is not None and dist > max_distance:
+            continue
+
+        d.metadata["kb_backend"] = backend
+        d.metadata["score"] = dist
+        out.append(Candidate(d, backend, dist, vec))
+    return out, (time.perf_counter() - t0) * 1000, cached
+
+def _doc_key(d):
+    return getattr(d, "id", None) or (d.metadata.get("source"), d.metadata.get("page"), d.page_content)
+
+def rrf_fuse(rankings, k=RRF_K):
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, d in enumerate(ranking):
+            key = _doc_key(d)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, d)
+
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    for key in ordered:
+        docs[key].metadata["rrf"] = scores[key]
+    return [docs[key] for key in ordered]
+
+def _search_lexical(user_id: int, query: str, k: int, stats):
+    t0 = time.perf_counter()
+    try:
+        docs = lexical_index.search(user_id, query, k=k, min_match=LEXICAL_MIN_MATCH)
+    except Exception:
+        stats["lexical"] = {"status": "error"}
+        return []
+    elapsed = time.perf_counter() - t0
+    observe("retrieve", "lexical", elapsed)
+    stats["lexical"] = {"status": "ok", "ms": round(elapsed * 1000, 1), "hits": len(docs)}
+    return docs
 
-def retrieve_merged(user, query: str, k_per_backend=3, k_total=4, max_distance=0.45):
-    merged = []
+def retrieve_merged(user, query: str, k_per_backend=3, k_total=4, max_distance=0.45,
+                    timeout=RETRIEVE_TIMEOUT_S, stats=None, mode=None):
+    params = {"k_per_backend": k_per_backend, "k_total": k_total, "max_distance": max_distance,
+              "timeout": timeout, "mode": mode}
+    if retrieval_client.enabled():
+        remote = retrieval_client.remote_retrieve(user.id, query, **params)
+        if remote is not None:
+            docs, remote_stats = remote
+            if stats is not None:
+                stats.update(remote_stats)
+                stats["daemon"] = True
+            return docs
+    return retrieve_local(user, query, stats=stats, **params)
 
-    for backend in list_existing_backends(user.id):
+def retrieve_local(user, query: str, k_per_backend=3, k_total=4, max_distance=0.45,
+                   timeout=RETRIEVE_TIMEOUT_S, stats=None, mode=None):
+    candidates = []
+    stats = {} if stats is None else stats
+    mode = mode or RETRIEVAL_MODE
+
+    if mode == "lexical":
+        return _search_lexical(user.id, query, k_total, stats)
+
+    # Over-fetch a candidate pool per backend and let the reranker pick the final k.
+    k_fetch = k_per_backend if RERANKER == "none" else max(k_per_backend, RERANK_POOL)
+
+    futures = {}
+    with span("retrieve", "list_backends"):
+        backends = backends_to_search(user, list_existing_backends(user.id))
+    for backend in backends:
         try:
             emb = get_embeddings_for_backend(user, backend)
         except Exception:
+            stats[backend] = {"status": "unavailable"}
             continue
 
         vs = get_vectorstore_for_backend(user.id, backend, emb)
-        try:
-            docs_scores = vs.similarity_search_with_score(query, k=k_per_backend)
-            for d, score in docs_scores:
-                score = float(score)
-                if max_distance is not None and score > max_distance:
-                    continue
+        futures[_executor_for(backend).submit(_search_backend, vs, backend, query, k_fetch, max_distance)] = backend
+
+    # The lexical index is local, so search it while the remote calls are in flight.
+    lexical = _search_lexical(user.id, query, k_fetch * 2, stats) if mode == "hybrid" else []
 
-                d.metadata["kb_backend"] = backend
-                d.metadata["score"] = float(score)
-                merged.append(d)
+    vector_ok = False
+    done, not_done = wait(futures, timeout=timeout) if futures else (set(), set())
 
+    for fut in done:
+        backend = futures[fut]
+        try:
+            found, ms, cached = fut.result()
         except Exception:
-            
-            #docs = vs.similarity_search(query, k=k_per_backend)
-            #for d in docs:
-                #d.metadata["kb_backend"] = backend
-                #merged.append(d)
+            # Another process may have dropped and recreated the collection;
+            # rebuild the pooled wrappers on the next turn.
+            invalidate_user(user.id, kinds=["vectorstores"])
+            stats[backend] = {"status": "error"}
             continue
+        stats[backend] = {"status": "ok", "ms": round(ms, 1), "hits": len(found),
+                          "query_cache": "hit" if cached else "miss"}
+        vector_ok = True
+        candidates.extend(found)
+
+    for fut in not_done:
+        fut.cancel()
+        stats[futures[fut]] = {"status": "timeout", "ms": round(timeout * 1000, 1)}
+    if futures:
+        stats["query_cache"] = get_query_cache().stats()
+
+    if mode == "hybrid" and not vector_ok:
+        # Every embedding backend is down or slow: answer from the lexical index alone.
+        return lexical[:k_total]
+
+    candidates = normalize_per_backend(candidates)
+
+    # Keyword hits only re-rank and extend what the vector side found; when
+    # it found nothing within max_distance the question is off-topic.
+    if mode == "hybrid" and lexical and candidates:
+        by_key = {_doc_key(c.doc): c for c in candidates}
+        fused = rrf_fuse([[c.doc for c in candidates], lexical])
+        top = fused[0].metadata["rrf"] if fused else 1.0
+        candidates = []
+        for d in fused:
+            c = by_key.get(_doc_key(d)) or Candidate(d, d.metadata.get("kb_backend", "lexical"))
+            c.score = d.metadata["rrf"] / top
+            candidates.append(c)
 
-    merged.sort(key=lambda d: d.metadata.get("score", 1e9))
-    return merged[:k_total]
+    t0 = time.perf_counter()
+    ranked = rerank(query, candidates, k_total)
+    elapsed = time.perf_counter() - t0
+    observe("retrieve", "rerank", elapsed)
+    stats["rerank"] = {"method": RERANKER, "ms": round(elapsed * 1000, 1),
+                       "candidates": len(candidates)}
+    return [c.doc for c in ranked]
@@ -0,0 +1,22 @@
+# Page extraction helpers that run inside a process pool. Kept free of
+# Django imports so spawned workers start quickly.
+_readers = {}
+
+
+def _reader(path: str):
+    r = _readers.get(path)
+    if r is None:
+        from pypdf import PdfReader
+        _readers.clear()
+        r = _readers[path] = PdfReader(path)
+    return r
+
+
+def count_pages(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path: str, start: int, stop: int):
+    reader = _reader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from django.conf import settings
+
+POOL_IDLE_S = getattr(settings, "POOL_IDLE_S", 900)
+_SWEEP_EVERY_S = 60
+
+_lock = threading.RLock()
+_users = {}
+_last_sweep = 0.0
+
+
+class _UserPool:
+    def __init__(self):
+        self.last_used = time.monotonic()
+        self.chroma_clients = {}
+        self.embeddings = {}
+        self.vectorstores = {}
+        self.llms = {}
+
+
+def _pool_for(user_id: int) -> _UserPool:
+    global _last_sweep
+    now = time.monotonic()
+    with _lock:
+        if now - _last_sweep > _SWEEP_EVERY_S:
+            _last_sweep = now
+            for uid in [u for u, p in _users.items() if now - p.last_used > POOL_IDLE_S]:
+                del _users[uid]
+
+        pool = _users.get(user_id)
+        if pool is None:
+            pool = _users[user_id] = _UserPool()
+        pool.last_used = now
+        return pool
+
+
+def pooled(user_id: int, kind: str, key, build):
+    pool = _pool_for(user_id)
+    cache = getattr(pool, kind)
+    with _lock:
+        if key in cache:
+            return cache[key]
+    obj = build()
+    with _lock:
+        return cache.setdefault(key, obj)
+
+
+def invalidate_user(user_id: int, kinds=None):
+    with _lock:
+        pool = _users.get(user_id)
+        if pool is None:
+            return
+        if kinds is None:
+            del _users[user_id]
+            return
+        for kind in kinds:
+            getattr(pool, kind).clear()
+
+
+def pool_stats():
+    with _lock:
+        return {
+            "users": len(_users),
+            "chroma_clients": sum(len(p.chroma_clients) for p in _users.values()),
+            "embeddings": sum(len(p.embeddings) for p in _users.values()),
+            "vectorstores": sum(len(p.vectorstores) for p in _users.values()),
+            "llms": sum(len(p.llms) for p in _users.values()),
+        }
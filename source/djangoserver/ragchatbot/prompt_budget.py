@@ -0,0 +1,130 @@
+import math
+from functools import lru_cache
+
+from django.conf import settings
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+# Rough per-message framing cost in chat formats (role markers, separators).
+MESSAGE_OVERHEAD = 4
+# Share of the space left after the system prompt and question that retrieved
+# context may use before history gets the rest.
+CONTEXT_SHARE = 0.6
+# Longest suffix/prefix overlap to look for between neighbouring chunks; a bit
+# above the splitter's 120-char chunk_overlap.
+MAX_OVERLAP = 200
+MIN_OVERLAP = 20
+
+@lru_cache(maxsize=16)
+def _encoder(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: str = "") -> int:
+    if not text:
+        return 0
+    enc = _encoder(model)
+    if enc is None:
+        return math.ceil(len(text) / 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+def budget_for_model(model: str) -> int:
+    budgets = getattr(settings, "PROMPT_TOKEN_BUDGETS", {})
+    best = ""
+    for prefix in budgets:
+        if model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    if best:
+        return budgets[best]
+    return getattr(settings, "PROMPT_TOKEN_BUDGET_DEFAULT", 6000)
+
+def _overlap(a: str, b: str) -> int:
+    for n in range(min(len(a), len(b), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+def dedupe_chunks(docs):
+    # Neighbouring chunks from one page repeat the splitter overlap; trim the
+    # repeated text and drop chunks that add nothing new.
+    kept = []
+    for d in docs:
+        text = d.page_content
+        for k in kept:
+            if text in k.page_content:
+                text = ""
+                break
+            if (k.metadata.get("source"), k.metadata.get("page")) != (d.metadata.get("source"), d.metadata.get("page")):
+                continue
+            n = _overlap(k.page_content, text)
+            if n:
+                text = text[n:]
+        if text.strip():
+            kept.append(d if text == d.page_content else Document(id=getattr(d, "id", None), page_content=text, metadata=d.metadata))
+    return kept
+
+def _format_chunk(i: int, d) -> str:
+    return f"[{i}] {d.metadata.get('source','')} p{d.metadata.get('page','?')}\n{d.page_content}"
+
+def assemble_messages(system_prompt: str, prompt: str, docs, history, model: str, summary: str = ""):
+    budget = budget_for_model(model)
+    report = {"budget": budget, "dropped_context_tokens": 0, "dropped_history_tokens": 0, "dropped_chunks": 0}
+
+    summary_msg = f"Summary of the earlier conversation:\n{summary}" if summary else ""
+    fixed = count_tokens(system_prompt, model) + count_tokens(prompt, model) + 2 * MESSAGE_OVERHEAD
+    if summary_msg:
+        fixed += count_tokens(summary_msg, model) + MESSAGE_OVERHEAD
+    remaining = max(0, budget - fixed)
+
+    unique = dedupe_chunks(docs)
+    report["dropped_chunks"] = len(docs) - len(unique)
+
+    context_budget = int(remaining * CONTEXT_SHARE) if history else remaining
+    parts, used = [], MESSAGE_OVERHEAD
+    for d in unique:
+        part = _format_chunk(len(parts) + 1, d)
+        cost = count_tokens(part, model)
+        if used + cost > context_budget:
+            report["dropped_context_tokens"] += cost
+            report["dropped_chunks"] += 1
+            continue
+        parts.append(part)
+        used += cost
+    context_used = used if parts else 0
+    remaining -= context_used
+
+    # Newest history first, so the oldest turns are the ones that get cut.
+    kept_history, history_used = [], 0
+    for item in reversed(history):
+        role = item.get("role")
+        if role not in ("user", "assistant"):
+            continue
+        content = item.get("content", "")
+        cost = count_tokens(content, model) + MESSAGE_OVERHEAD
+        if cost > remaining:
+            report["dropped_history_tokens"] += cost
+            remaining = 0
+            continue
+        kept_history.append((role, content))
+        history_used += cost
+        remaining -= cost
+    kept_history.reverse()
+
+    messages = [SystemMessage(content=system_prompt)]
+    if summary_msg:
+        messages.append(SystemMessage(content=summary_msg))
+    if parts:
+        context = "\n\n".join(parts)
+        messages.append(SystemMessage(content=f"Use the following retrieved context when helpful:\n\n{context}"))
+    for role, content in kept_history:
+        messages.append(HumanMessage(content=content) if role == "user" else AIMessage(content=content))
+    messages.append(HumanMessage(content=prompt))
+
+    report["prompt_tokens"] = fixed + context_used + history_used
+    return messages, report
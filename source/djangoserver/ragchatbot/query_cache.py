@@ -0,0 +1,73 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+
+# In-process LRU of query embeddings keyed by (backend, model, normalised
+# text). It sits in front of CachedEmbeddings, whose SQLite table is the
+# optional on-disk layer, so a repeated prompt (regenerate, answer-cache
+# probe after retrieval) costs a dict lookup instead of a remote call.
+QUERY_EMBED_CACHE_SIZE = getattr(settings, "QUERY_EMBED_CACHE_SIZE", 1024)
+
+_WS = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    return _WS.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+def embeddings_model(embeddings) -> str:
+    return str(getattr(embeddings, "model", "") or getattr(embeddings, "model_name", "") or "")
+
+class QueryEmbeddingLRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            vec = self._items.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key, vec):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = vec
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+_cache = QueryEmbeddingLRU(QUERY_EMBED_CACHE_SIZE)
+
+def get_query_cache():
+    return _cache
+
+def embed_query_cached(embeddings, backend: str, text: str):
+    # Returns (vector, hit).
+    normalized = normalize_query(text)
+    key = (backend, embeddings_model(embeddings), normalized)
+    vec = _cache.get(key)
+    if vec is not None:
+        return vec, True
+    vec = embeddings.embed_query(normalized)
+    _cache.put(key, vec)
+    return vec, False
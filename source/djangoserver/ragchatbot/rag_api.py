@@ -1,36 +1,25 @@
 ﻿import os
+import json
 import traceback
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
-from django.core.files.storage import default_storage
 from django.conf import settings
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-
 from .models import KnowledgeFile, LLMSettings
 from .embeddings_factory import get_embeddings_for_user
 from .embedding_backends import get_embeddings_for_backend
-from .rag_store import get_vectorstore_for_backend
+from .ingest_jobs import (
+    enqueue_backfill_job, enqueue_ingest_job, fanout_backends, run_ingest_job, ingest_job_to_dict,
+    last_ingest_status,
+)
+from .blob_store import release_file, save_upload_blob
+from .metrics import span
+from .rag_store import BACKENDS
 
 MAX_BYTES = 50 * 1024 * 1024
 ALLOWED_EXT = {".pdf", ".txt", ".md"}
 
-def load_file_to_docs(file_path: str, original_name: str):
-    ext = os.path.splitext(original_name.lower())[1]
-    if ext == ".pdf":
-        from langchain_community.document_loaders import PyPDFLoader
-        docs = PyPDFLoader(file_path).load()
-    elif ext in {".txt", ".md"}:
-        from langchain_community.document_loaders import TextLoader
-        docs = TextLoader(file_path, encoding="utf-8").load()
-    else:
-        raise ValueError(f"Unsupported file type: {ext}")
-
-    for d in docs:
-        d.metadata["source"] = original_name
-    return docs
-
 @login_required
 @require_POST
 def upload_and_ingest(request):
@@ -47,35 +36,49 @@ def upload_and_ingest(request):
                 return JsonResponse({"error": f"{f.name}: unsupported type {ext}"}, status=400)
 
         cfg, _ = LLMSettings.objects.get_or_create(user=request.user)
-        backend = cfg.provider  
+        backend = cfg.provider
 
-        embeddings = get_embeddings_for_backend(request.user, backend)
-        vs = get_vectorstore_for_backend(request.user.id, backend, embeddings)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=900, chunk_overlap=120)
+        # Fail fast on a misconfigured provider instead of queueing a job that can't run.
+        get_embeddings_for_backend(request.user, backend)
 
-        ingested = []
+        timings = {}
+        kfs, skipped, unused = [], [], []
         for f in files:
-            saved_path = default_storage.save(f"uploads/{request.user.id}/{f.name}", f)
-            abs_path = default_storage.path(saved_path)
-
-            KnowledgeFile.objects.create(
-                user=request.user,
-                file=saved_path,
-                original_name=f.name,
-                size_bytes=f.size,
-                backend=backend,
-            )
-
-            docs = load_file_to_docs(abs_path, f.name)
-            for d in docs:
-                d.metadata["user_id"] = request.user.id
-
-            chunks = splitter.split_documents(docs)
-            vs.add_documents(chunks)
-
-            ingested.append({"name": f.name, "chunks": len(chunks)})
-
-        return JsonResponse({"ok": True, "files": ingested})
+            with span("ingest", "save", timings), save_upload_blob(f) as (sha256, saved_path):
+                existing = KnowledgeFile.objects.filter(user=request.user, backend=backend, sha256=sha256).first()
+                if existing is None:
+                    kfs.append(KnowledgeFile.objects.create(
+                        user=request.user,
+                        file=saved_path,
+                        original_name=f.name,
+                        size_bytes=f.size,
+                        backend=backend,
+                        sha256=sha256,
+                    ))
+                    continue
+            if saved_path != existing.file.name:
+                unused.append(saved_path)
+            if last_ingest_status(existing) == "failed":
+                # Same bytes as a file whose ingest failed: try that file again.
+                if existing not in kfs:
+                    kfs.append(existing)
+            else:
+                # Same bytes already indexed (or on their way) for this backend.
+                skipped.append((f.name, existing))
+        for name in unused:
+            release_file(name)
+
+        extra = fanout_backends(request.user, backend)
+        with span("ingest", "enqueue", timings):
+            job = enqueue_ingest_job(request.user, backend, kfs, skipped=skipped, extra_backends=extra)
+        if kfs and getattr(settings, "INGEST_INLINE", False):
+            run_ingest_job(job, timings=timings)
+            job.refresh_from_db()
+
+        data = {"ok": True, **ingest_job_to_dict(job)}
+        if getattr(settings, "EXPOSE_TIMINGS", False):
+            data["timings"] = timings
+        return JsonResponse(data)
 
     except ValueError as e:
         return JsonResponse(
@@ -89,3 +92,29 @@ def upload_and_ingest(request):
             payload["detail"] = str(e)
             payload["trace"] = traceback.format_exc()
         return JsonResponse(payload, status=500)
+
+@login_required
+@require_POST
+def backfill_backend(request):
+    # Embed the user's existing files into another backend so retrieval can
+    # answer from that one collection.
+    payload = json.loads(request.body.decode("utf-8") or "{}")
+    backend = payload.get("backend") or ""
+    if backend not in BACKENDS:
+        return JsonResponse({"error": f"Unknown backend: {backend}"}, status=400)
+
+    try:
+        get_embeddings_for_backend(request.user, backend)
+    except ValueError as e:
+        return JsonResponse(
+            {"error": str(e), "hint": "Check Settings → provider/keys/URLs and try again."},
+            status=400
+        )
+
+    job = enqueue_backfill_job(request.user, backend)
+    if job is None:
+        return JsonResponse({"ok": True, "job_id": None, "status": "done", "files": []})
+    if getattr(settings, "INGEST_INLINE", False):
+        run_ingest_job(job)
+        job.refresh_from_db()
+    return JsonResponse({"ok": True, **ingest_job_to_dict(job)})
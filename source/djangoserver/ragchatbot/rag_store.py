@@ -1,19 +1,239 @@
+import threading
 from pathlib import Path
 from django.conf import settings
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from .pools import pooled
+
+BACKENDS = ["openai", "google", "ollama"]
+if getattr(settings, "FAKE_PROVIDERS", False):
+    BACKENDS.append("fake")
+
+# "per_user": one Chroma directory per user (the original layout).
+# "shared": one directory for everyone, one collection per backend, and every
+# read/delete filtered by the chunk's user_id metadata.
+VECTOR_STORE_LAYOUT = getattr(settings, "VECTOR_STORE_LAYOUT", "per_user")
+
+# "auto": answer queries from an exact in-memory index while a user's
+# collection is at most EXACT_INDEX_MAX_CHUNKS, from HNSW above that.
+# "chroma": always HNSW.
+VECTOR_ENGINE = getattr(settings, "VECTOR_ENGINE", "auto")
+EXACT_INDEX_MAX_CHUNKS = getattr(settings, "EXACT_INDEX_MAX_CHUNKS", 5000)
+VECTOR_QUANTIZATION = getattr(settings, "VECTOR_QUANTIZATION", "none")
+QUANT_RESCORE_FACTOR = getattr(settings, "QUANT_RESCORE_FACTOR", 4)
+
+_shared_client = None
+_shared_lock = threading.Lock()
 
 def user_chroma_dir(user_id: int) -> str:
     base = Path(settings.BASE_DIR) / "chroma" / f"user_{user_id}"
     base.mkdir(parents=True, exist_ok=True)
     return str(base)
 
+def shared_chroma_dir() -> str:
+    base = Path(settings.BASE_DIR) / "chroma" / "shared"
+    base.mkdir(parents=True, exist_ok=True)
+    return str(base)
+
 def collection_name_for_backend(backend: str) -> str:
     return f"kb_{backend}_v1"   
 
+def get_chroma_client(user_id: int):
+    from chromadb import PersistentClient
+    path = user_chroma_dir(user_id)
+    return pooled(user_id, "chroma_clients", path, lambda: PersistentClient(path=path))
+
+def get_shared_chroma_client():
+    global _shared_client
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                from chromadb import PersistentClient
+                _shared_client = PersistentClient(path=shared_chroma_dir())
+    return _shared_client
+
+class ChromaVectorStore:
+    # Thin layer over one Chroma collection. With tenant_id set, every read
+    # and bulk delete is restricted to that user's chunks.
+    def __init__(self, client, backend: str, embedding_function, tenant_id=None):
+        self.client = client
+        self.backend = backend
+        self.tenant_id = tenant_id
+        self.lc = Chroma(
+            client=client,
+            collection_name=collection_name_for_backend(backend),
+            embedding_function=embedding_function,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+
+    @property
+    def embeddings(self):
+        return self.lc.embeddings
+
+    @property
+    def collection(self):
+        return self.lc._collection
+
+    def _where(self, where=None):
+        if self.tenant_id is None:
+            return where
+        tenant = {"user_id": self.tenant_id}
+        return {"$and": [tenant, where]} if where else tenant
+
+    def get(self, ids=None, where=None, include=(), limit=None, offset=None):
+        return self.collection.get(
+            ids=ids, where=self._where(where), include=list(include), limit=limit, offset=offset
+        )
+
+    def delete(self, ids):
+        self.collection.delete(ids=list(ids))
+
+    def delete_all(self):
+        if self.tenant_id is None:
+            self.client.delete_collection(self.collection.name)
+        else:
+            self.collection.delete(where=self._where())
+
+    def has_data(self) -> bool:
+        if self.tenant_id is None:
+            return self.collection.count() > 0
+        return bool(self.get(limit=1).get("ids"))
+
+    def add_documents(self, docs, ids=None):
+        return self.lc.add_documents(docs, ids=ids)
+
+    def upsert(self, ids, vectors, docs):
+        self.collection.upsert(
+            ids=list(ids),
+            embeddings=[list(v) for v in vectors],
+            documents=[d.page_content for d in docs],
+            metadatas=[d.metadata for d in docs],
+        )
+
+    def similarity_search_with_score(self, query: str, k: int):
+        return self.lc.similarity_search_with_score(query, k=k, filter=self._where())
+
+    def query(self, query_embedding, k: int):
+        res = self.collection.query(
+            query_embeddings=[list(query_embedding)],
+            n_results=k,
+            where=self._where(),
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+        out = []
+        for cid, text, meta, dist, vec in zip(
+            res["ids"][0], res["documents"][0], res["metadatas"][0], res["distances"][0], res["embeddings"][0]
+        ):
+            out.append((Document(id=cid, page_content=text or "", metadata=dict(meta or {})), float(dist), vec))
+        return out
+
+def build_vectorstore(layout: str, user_id: int, backend: str, embedding_function):
+    if layout == "shared":
+        return ChromaVectorStore(get_shared_chroma_client(), backend, embedding_function, tenant_id=user_id)
+    if layout == "per_user":
+        return ChromaVectorStore(get_chroma_client(user_id), backend, embedding_function)
+    raise ValueError(f"Unknown vector store layout: {layout}")
+
+def exact_index_dir(layout: str, user_id: int, backend: str) -> str:
+    # Kept per user even in the shared layout, so clearing a user's
+    # directory drops their mirror with it.
+    return str(Path(user_chroma_dir(user_id)) / "exact" / f"{layout}_{backend}")
+
+def invalidate_exact_index(layout: str, user_id: int, backend: str):
+    from .exact_index import ExactIndex
+    ExactIndex(exact_index_dir(layout, user_id, backend)).invalidate()
+
+def build_engine(engine: str, layout: str, user_id: int, backend: str, embedding_function):
+    if engine == "chroma":
+        return build_vectorstore(layout, user_id, backend, embedding_function)
+    if engine == "auto":
+        from .exact_index import TieredVectorStore
+        return TieredVectorStore(
+            lambda: build_vectorstore(layout, user_id, backend, embedding_function),
+            exact_index_dir(layout, user_id, backend),
+            EXACT_INDEX_MAX_CHUNKS,
+            backend,
+            embedding_function,
+            quantization=VECTOR_QUANTIZATION,
+            rescore_factor=QUANT_RESCORE_FACTOR,
+        )
+    raise ValueError(f"Unknown vector engine: {engine}")
+
 def get_vectorstore_for_backend(user_id: int, backend: str, embedding_function):
-    return Chroma(
-        collection_name=collection_name_for_backend(backend),
-        persist_directory=user_chroma_dir(user_id),
-        embedding_function=embedding_function,
-        collection_metadata={"hnsw:space": "cosine"},
-    )
+    # Keyed by the embeddings object, which is itself pooled per settings version.
+    # The entry keeps a reference to it so the id can't be reused while cached.
+    key = (VECTOR_ENGINE, VECTOR_STORE_LAYOUT, backend, id(embedding_function))
+    _emb, vs = pooled(user_id, "vectorstores", key,
+                      lambda: (embedding_function, build_engine(VECTOR_ENGINE, VECTOR_STORE_LAYOUT, user_id, backend, embedding_function)))
+    return vs
+
+def list_backends_with_data(user_id: int):
+    if VECTOR_STORE_LAYOUT == "per_user":
+        existing = {c.name for c in get_chroma_client(user_id).list_collections()}
+        return [b for b in BACKENDS if collection_name_for_backend(b) in existing]
+    existing = {c.name for c in get_shared_chroma_client().list_collections()}
+    return [
+        b for b in BACKENDS
+        if collection_name_for_backend(b) in existing
+        and get_vectorstore_for_backend(user_id, b, None).has_data()
+    ]
+
+def delete_backend_vectors(user_id: int, backend: str):
+    get_vectorstore_for_backend(user_id, backend, None).delete_all()
+
+def chunk_ids_for_file(kf_id: int, n: int, start: int = 0):
+    return [f"kf{kf_id}_{i}" for i in range(start, start + n)]
+
+def delete_file_vectors(vs, kf_id: int) -> int:
+    found = vs.get(where={"kb_file_id": kf_id})
+    ids = found.get("ids") or []
+    if ids:
+        vs.delete(ids=ids)
+    return len(ids)
+
+def _untagged_ids(vs, source: str):
+    # Chunks ingested before they carried kb_file_id can only be found by source.
+    found = vs.get(where={"source": source}, include=["metadatas"])
+    return [
+        i for i, m in zip(found.get("ids") or [], found.get("metadatas") or [])
+        if "kb_file_id" not in (m or {})
+    ]
+
+def has_untagged_chunks(vs, source: str) -> bool:
+    return bool(_untagged_ids(vs, source))
+
+def delete_untagged_chunks(vs, source: str) -> int:
+    ids = _untagged_ids(vs, source)
+    if ids:
+        vs.delete(ids=ids)
+    return len(ids)
+
+def delete_file_chunks(user_id: int, kf_id: int, backends, source: str = "", sole_source: bool = False):
+    # Returns (removed, needs_rebuild). A file with no tagged chunks may be
+    # a legacy one: its untagged chunks are only ever in the primary backend
+    # (backends[0]) and can be removed by source when no other file of the
+    # user shares that name; otherwise the caller has to rebuild the backend.
+    removed = sum(delete_file_vectors(get_vectorstore_for_backend(user_id, b, None), kf_id) for b in backends)
+    if removed or not source or not backends:
+        return removed, False
+    primary = get_vectorstore_for_backend(user_id, backends[0], None)
+    if sole_source:
+        return delete_untagged_chunks(primary, source), False
+    return 0, has_untagged_chunks(primary, source)
+
+def existing_ids(vs, ids):
+    if not ids:
+        return set()
+    found = vs.get(ids=list(ids))
+    return set(found.get("ids") or [])
+
+def upsert_vectors(vs, ids, vectors, docs):
+    # Write precomputed embeddings straight to the collection so batches
+    # embedded by the scheduler aren't embedded a second time by add_documents.
+    vs.upsert(ids, vectors, docs)
+
+def query_with_vectors(vs, query_embedding, k: int):
+    # Like similarity_search_with_score, but also returns each hit's stored
+    # embedding so the reranker can compare candidates with each other.
+    return vs.query(query_embedding, k)
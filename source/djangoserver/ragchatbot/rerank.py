@@ -0,0 +1,137 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+from django.conf import settings
+
+RERANKER = getattr(settings, "RERANKER", "mmr")
+RERANK_POOL = getattr(settings, "RERANK_POOL", 8)
+RERANK_BUDGET_S = getattr(settings, "RERANK_BUDGET_S", 0.25)
+MMR_LAMBDA = getattr(settings, "MMR_LAMBDA", 0.7)
+SCORE_NORMALIZATION = getattr(settings, "SCORE_NORMALIZATION", "zscore")
+
+logger = logging.getLogger(__name__)
+
+_cross_encoder = None
+_loader = None
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+
+class Candidate:
+    __slots__ = ("doc", "backend", "distance", "vector", "score")
+
+    def __init__(self, doc, backend: str, distance: float = None, vector=None):
+        self.doc = doc
+        self.backend = backend
+        self.distance = distance
+        self.vector = vector
+        self.score = 0.0
+
+
+def normalize_per_backend(candidates, method: str = SCORE_NORMALIZATION):
+    # Cosine distances from different embedding models aren't on one scale,
+    # so each backend's similarities are normalised against its own pool.
+    by_backend = {}
+    for c in candidates:
+        by_backend.setdefault(c.backend, []).append(c)
+
+    for group in by_backend.values():
+        sims = 1.0 - np.array([c.distance for c in group], dtype=np.float32)
+        if method == "minmax":
+            span = float(sims.max() - sims.min())
+            norm = (sims - sims.min()) / span if span > 1e-6 else np.ones_like(sims)
+        elif method == "zscore":
+            std = float(sims.std())
+            z = (sims - sims.mean()) / std if std > 1e-6 else np.zeros_like(sims)
+            # Blend in the raw similarity so a pool of uniformly weak hits
+            # doesn't get a top score just for being the best of a bad lot.
+            norm = 0.5 * (1.0 / (1.0 + np.exp(-z))) + 0.5 * np.clip(sims, 0.0, 1.0)
+        else:
+            norm = sims
+        for c, s in zip(group, norm):
+            c.score = float(s)
+            c.doc.metadata["norm_score"] = float(s)
+    return sorted(candidates, key=lambda c: c.score, reverse=True)
+
+
+def _similarity_matrix(candidates):
+    n = len(candidates)
+    sim = np.zeros((n, n), dtype=np.float32)
+    by_backend = {}
+    for i, c in enumerate(candidates):
+        if c.vector is not None:
+            by_backend.setdefault(c.backend, []).append(i)
+
+    # Vectors from different backends live in different spaces (and often
+    # have different dimensions), so only same-backend pairs are compared.
+    for idx in by_backend.values():
+        m = np.asarray([candidates[i].vector for i in idx], dtype=np.float32)
+        m /= np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+        sim[np.ix_(idx, idx)] = m @ m.T
+    return sim
+
+
+def mmr_rerank(candidates, k: int, lam: float = MMR_LAMBDA):
+    n = len(candidates)
+    if n <= 1:
+        return list(candidates[:k])
+
+    rel = np.array([c.score for c in candidates], dtype=np.float32)
+    sim = _similarity_matrix(candidates)
+    max_sim = np.zeros(n, dtype=np.float32)
+    taken = np.zeros(n, dtype=bool)
+    order = []
+
+    for _ in range(min(k, n)):
+        mmr = lam * rel - (1.0 - lam) * max_sim
+        mmr[taken] = -np.inf
+        i = int(np.argmax(mmr))
+        order.append(i)
+        taken[i] = True
+        max_sim = np.maximum(max_sim, sim[i])
+    return [candidates[i] for i in order]
+
+
+def _load_cross_encoder():
+    global _cross_encoder
+    try:
+        from sentence_transformers import CrossEncoder
+        _cross_encoder = CrossEncoder(getattr(settings, "CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+    except Exception:
+        # Missing package, failed download: stay on MMR for this process.
+        logger.exception("Could not load the cross-encoder; reranking with MMR")
+
+
+def warm_up():
+    # Loads the cross-encoder in the background, once per process, so the
+    # download and load never count against a request's rerank budget.
+    global _loader
+    if RERANKER != "cross-encoder" or _loader is not None:
+        return
+    _loader = threading.Thread(target=_load_cross_encoder, name="rerank-load", daemon=True)
+    _loader.start()
+
+
+def cross_encoder_rerank(query: str, candidates, k: int):
+    scores = _cross_encoder.predict([(query, c.doc.page_content) for c in candidates])
+    order = np.argsort(-np.asarray(scores))[:k]
+    return [candidates[i] for i in order]
+
+
+def rerank(query: str, candidates, k: int, method: str = RERANKER, budget_s: float = RERANK_BUDGET_S):
+    if method == "none" or len(candidates) <= 1:
+        return list(candidates[:k])
+
+    if method == "cross-encoder":
+        warm_up()
+        if _cross_encoder is not None:
+            fut = _executor.submit(cross_encoder_rerank, query, candidates, k)
+            try:
+                return fut.result(timeout=budget_s)
+            except FutureTimeout:
+                pass
+            except Exception:
+                logger.exception("Cross-encoder rerank failed; falling back to MMR")
+        # Still loading, unavailable, over budget or failed: MMR always fits.
+    return mmr_rerank(candidates, k)
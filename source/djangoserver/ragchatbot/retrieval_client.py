@@ -0,0 +1,95 @@
+import json
+import socket
+import struct
+import threading
+import time
+
+from django.conf import settings
+from langchain_core.documents import Document
+
+# Client side of the optional retrieval daemon (manage.py retrieval_daemon).
+# With RETRIEVAL_DAEMON_SOCKET unset, or the daemon unreachable, callers get
+# None back and fall through to in-process retrieval.
+RETRIEVAL_DAEMON_SOCKET = getattr(settings, "RETRIEVAL_DAEMON_SOCKET", "")
+RETRIEVAL_DAEMON_TIMEOUT_S = getattr(settings, "RETRIEVAL_DAEMON_TIMEOUT_S", 10.0)
+# After a failed call, stay in-process this long before trying the socket again.
+_RETRY_AFTER_S = 5.0
+
+_local = threading.local()
+_down_until = 0.0
+# Set inside the daemon so its own calls never loop back to the socket.
+serving = False
+
+def enabled() -> bool:
+    return bool(RETRIEVAL_DAEMON_SOCKET) and not serving and time.monotonic() >= _down_until
+
+def write_frame(sock, obj):
+    data = json.dumps(obj).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+def _recv_exact(sock, n: int) -> bytes:
+    buf = b""
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            raise ConnectionError("retrieval daemon closed the connection")
+        buf += part
+    return buf
+
+def read_frame(sock):
+    (n,) = struct.unpack(">I", _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, n).decode("utf-8"))
+
+def _connection():
+    # One connection per thread, reused across requests.
+    sock = getattr(_local, "sock", None)
+    if sock is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(RETRIEVAL_DAEMON_TIMEOUT_S)
+        sock.connect(RETRIEVAL_DAEMON_SOCKET)
+        _local.sock = sock
+    return sock
+
+def _call(msg):
+    global _down_until
+    if not enabled():
+        return None
+    try:
+        sock = _connection()
+        write_frame(sock, msg)
+        reply = read_frame(sock)
+    except (OSError, ValueError, ConnectionError):
+        sock = getattr(_local, "sock", None)
+        if sock is not None:
+            sock.close()
+            _local.sock = None
+        _down_until = time.monotonic() + _RETRY_AFTER_S
+        return None
+    if not reply.get("ok"):
+        return None
+    return reply
+
+def doc_to_dict(d):
+    return {"id": getattr(d, "id", None), "page_content": d.page_content, "metadata": d.metadata}
+
+def remote_retrieve(user_id: int, query: str, **params):
+    # Returns (docs, stats) or None when the daemon can't answer.
+    reply = _call({"op": "retrieve", "user_id": user_id, "query": query, "params": params})
+    if reply is None:
+        return None
+    docs = [Document(id=d.get("id"), page_content=d["page_content"], metadata=d["metadata"]) for d in reply["docs"]]
+    return docs, reply.get("stats", {})
+
+def remote_delete_file_chunks(user_id: int, kf_id: int, backends, source: str = "", sole_source: bool = False):
+    # Returns rag_store.delete_file_chunks' (removed, needs_rebuild), or
+    # None when the daemon can't answer.
+    reply = _call({
+        "op": "delete_file", "user_id": user_id, "kb_file_id": kf_id, "backends": list(backends),
+        "source": source, "sole_source": sole_source,
+    })
+    return None if reply is None else (reply["removed"], reply.get("needs_rebuild", False))
+
+def notify_invalidate(user_id: int, kinds=None):
+    # Writes happen outside the daemon (upload view, ingest worker, deletes);
+    # tell it to reopen that user's stores so it doesn't serve stale results.
+    _call({"op": "invalidate", "user_id": user_id, "kinds": kinds})
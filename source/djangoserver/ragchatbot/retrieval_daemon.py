@@ -0,0 +1,124 @@
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+
+from . import retrieval_client
+from .pools import invalidate_user, pool_stats
+from .retrieval_client import doc_to_dict, read_frame, write_frame
+
+# One process per host that owns every pooled Chroma client, vector store and
+# embedding object, so web workers don't each hold a copy. Requests arriving
+# within BATCH_WINDOW_MS of each other are handled as one batch: identical
+# queries share a single retrieval and the rest run side by side.
+BATCH_WINDOW_MS = getattr(settings, "RETRIEVAL_DAEMON_BATCH_MS", 5)
+BATCH_MAX = 64
+
+class Batcher:
+    def __init__(self, threads: int):
+        self.inbox = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="daemon-retrieve")
+        self.batches = 0
+        self.requests = 0
+        self.coalesced = 0
+        threading.Thread(target=self._loop, name="daemon-batcher", daemon=True).start()
+
+    def submit(self, user_id: int, query: str, params: dict) -> Future:
+        fut = Future()
+        self.inbox.put(((user_id, query, tuple(sorted(params.items()))), fut))
+        return fut
+
+    def _loop(self):
+        while True:
+            batch = [self.inbox.get()]
+            deadline = time.monotonic() + BATCH_WINDOW_MS / 1000.0
+            while len(batch) < BATCH_MAX:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self.inbox.get(timeout=left))
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for key, fut in batch:
+                groups.setdefault(key, []).append(fut)
+            self.batches += 1
+            self.requests += len(batch)
+            self.coalesced += len(batch) - len(groups)
+            for key, futs in groups.items():
+                self.pool.submit(self._run, key, futs)
+
+    def _run(self, key, futs):
+        from .multi_retriever import retrieve_local
+
+        user_id, query, params = key
+        try:
+            close_old_connections()
+            user = User.objects.get(id=user_id)
+            stats = {}
+            docs = retrieve_local(user, query, stats=stats, **dict(params))
+            result = {"ok": True, "docs": [doc_to_dict(d) for d in docs], "stats": stats}
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        for fut in futs:
+            fut.set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "requests": self.requests, "coalesced": self.coalesced}
+
+def _delete_file(user_id: int, kf_id: int, backends, source: str = "", sole_source: bool = False):
+    from .rag_store import delete_file_chunks
+
+    try:
+        removed, needs_rebuild = delete_file_chunks(user_id, kf_id, backends, source, sole_source)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "removed": removed, "needs_rebuild": needs_rebuild}
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                msg = read_frame(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            op = msg.get("op")
+            if op == "retrieve":
+                reply = batcher.submit(msg["user_id"], msg["query"], msg.get("params") or {}).result()
+            elif op == "delete_file":
+                reply = _delete_file(
+                    msg["user_id"], msg["kb_file_id"], msg.get("backends") or [],
+                    msg.get("source") or "", bool(msg.get("sole_source")),
+                )
+            elif op == "invalidate":
+                invalidate_user(msg["user_id"], kinds=msg.get("kinds"))
+                reply = {"ok": True}
+            elif op == "stats":
+                reply = {"ok": True, "pools": pool_stats(), "batches": batcher.stats()}
+            else:
+                reply = {"ok": False, "error": f"Unknown op: {op}"}
+            write_frame(self.request, reply)
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def serve(path: str, threads: int = 8):
+    from .rerank import warm_up
+
+    retrieval_client.serving = True
+    warm_up()
+    if os.path.exists(path):
+        os.unlink(path)
+    server = _Server(path, _Handler)
+    server.batcher = Batcher(threads)
+    os.chmod(path, 0o660)
+    return server
@@ -1,4 +1,5 @@
 import os
+import django
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -14,6 +15,110 @@ MEDIA_ROOT = BASE_DIR / "media"
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024
 
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_PATH = BASE_DIR / "chroma" / "embedding_cache.sqlite3"
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+# In-process LRU of query embeddings in front of the on-disk cache (0 disables).
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+
+# Offline stand-ins (backend/provider "fake") for `manage.py bench_e2e`.
+# Never enable on a deployment that serves real users.
+FAKE_PROVIDERS = os.getenv("FAKE_PROVIDERS", "0") == "1"
+FAKE_TOKEN_DELAY_S = float(os.getenv("FAKE_TOKEN_DELAY_S", "0.02"))
+
+INGEST_INLINE = os.getenv("INGEST_INLINE", "0") == "1"
+# Opt-in fan-out: also embed uploads into these backends (comma-separated,
+# e.g. "openai,ollama") in the same parse pass, when the user has them set up.
+# Switching provider then backfills existing files into the new backend.
+INGEST_FANOUT_BACKENDS = [b.strip() for b in os.getenv("INGEST_FANOUT_BACKENDS", "").split(",") if b.strip()]
+PDF_PARSE_PROCESSES = int(os.getenv("PDF_PARSE_PROCESSES", "2"))
+
+# Per-backend ingest embedding limits: chunks per request, concurrent
+# requests and requests per second (0 = unlimited).
+EMBED_LIMITS = {
+    "openai": {"batch_size": 96, "in_flight": 4, "rps": 8},
+    "google": {"batch_size": 64, "in_flight": 2, "rps": 4},
+    "ollama": {"batch_size": 32, "in_flight": 1, "rps": 0},
+}
+
+# "per_user" (one Chroma directory per user) or "shared" (one collection per
+# backend filtered by user_id). Move data with `manage.py migrate_vector_layout`.
+VECTOR_STORE_LAYOUT = os.getenv("VECTOR_STORE_LAYOUT", "per_user")
+
+# "auto" serves small collections from an exact in-memory index and switches
+# to Chroma's HNSW above EXACT_INDEX_MAX_CHUNKS; "chroma" always uses HNSW.
+# Find the crossover on your hardware with `manage.py bench_exact_index`.
+VECTOR_ENGINE = os.getenv("VECTOR_ENGINE", "auto")
+EXACT_INDEX_MAX_CHUNKS = int(os.getenv("EXACT_INDEX_MAX_CHUNKS", "5000"))
+
+# Storage for the exact index: "none" (float32), "float16" or "int8". The
+# quantized mirror replaces the float32 one, and its top QUANT_RESCORE_FACTOR
+# * k hits are rescored against float32 vectors read from Chroma. Only applies
+# up to EXACT_INDEX_MAX_CHUNKS; Chroma's own storage is never quantized.
+# Compare recall and size with `manage.py bench_quantization`.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+QUANT_RESCORE_FACTOR = int(os.getenv("QUANT_RESCORE_FACTOR", "4"))
+
+RETRIEVE_TIMEOUT_S = float(os.getenv("RETRIEVE_TIMEOUT_S", "4.0"))
+# HTTP timeout for embedding provider calls, so a hung backend frees its
+# thread instead of holding it until the connection drops.
+EMBED_REQUEST_TIMEOUT_S = float(os.getenv("EMBED_REQUEST_TIMEOUT_S", "30"))
+
+# Optional shared retrieval process (`manage.py retrieval_daemon`). When set,
+# web workers send searches to this socket and fall back to in-process
+# retrieval if it is unreachable.
+RETRIEVAL_DAEMON_SOCKET = os.getenv("RETRIEVAL_DAEMON_SOCKET", "")
+RETRIEVAL_DAEMON_TIMEOUT_S = float(os.getenv("RETRIEVAL_DAEMON_TIMEOUT_S", "10"))
+RETRIEVAL_DAEMON_BATCH_MS = int(os.getenv("RETRIEVAL_DAEMON_BATCH_MS", "5"))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Fraction of the query's terms a keyword (BM25) hit must contain.
+LEXICAL_MIN_MATCH = float(os.getenv("LEXICAL_MIN_MATCH", "0.5"))
+
+# Reranking of merged retrieval candidates: "mmr", "cross-encoder" (needs
+# sentence-transformers) or "none". RERANK_POOL is the per-backend over-fetch.
+RERANKER = os.getenv("RERANKER", "mmr")
+RERANK_POOL = int(os.getenv("RERANK_POOL", "8"))
+RERANK_BUDGET_S = float(os.getenv("RERANK_BUDGET_S", "0.25"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+SCORE_NORMALIZATION = os.getenv("SCORE_NORMALIZATION", "zscore")
+
+POOL_IDLE_S = int(os.getenv("POOL_IDLE_S", "900"))
+
+# Serve the chat stream from the async view; only useful under an ASGI server.
+CHAT_STREAM_ASYNC = os.getenv("CHAT_STREAM_ASYNC", "0") == "1"
+
+# Coalesce streamed tokens into one SSE frame per interval (0 = one frame per chunk).
+STREAM_COALESCE_MS = int(os.getenv("STREAM_COALESCE_MS", "0"))
+STREAM_COALESCE_CHARS = int(os.getenv("STREAM_COALESCE_CHARS", "256"))
+# Save the in-progress answer as a partial message this often (0 = only on disconnect).
+STREAM_CHECKPOINT_S = float(os.getenv("STREAM_CHECKPOINT_S", "5"))
+
+# Per-stage timings in the chat "done" event and the upload response.
+EXPOSE_TIMINGS = os.getenv("EXPOSE_TIMINGS", "0") == "1"
+# Bearer token for scraping /metrics; staff sessions can always read it.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Where processes without HTTP (ingest workers) leave metric snapshots for /metrics.
+METRICS_DIR = Path(os.getenv("METRICS_DIR", str(BASE_DIR / "metrics")))
+
+# Prompt token budgets, matched by longest model-name prefix.
+PROMPT_TOKEN_BUDGETS = {
+    "gpt-4o": 16000,
+    "gpt-4.1": 16000,
+    "gemini": 16000,
+    "llama3": 6000,
+}
+PROMPT_TOKEN_BUDGET_DEFAULT = int(os.getenv("PROMPT_TOKEN_BUDGET_DEFAULT", "6000"))
+
+# Chat history is loaded server-side: messages beyond HISTORY_WINDOW are
+# folded into a rolling per-chat summary, keeping the newest HISTORY_KEEP.
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "16"))
+HISTORY_KEEP = int(os.getenv("HISTORY_KEEP", "8"))
+
+# Replay answers for near-identical questions against an unchanged knowledge base.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "0") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+
 SECRET_KEY = 'django-insecure-n)jnj3y-i+s0i0_jv4!!qeqm&869i*&nrnk@so-r1dfg_-)4d3'
 DEBUG = True
 
@@ -65,12 +170,27 @@ WSGI_APPLICATION = 'ragchatbot.wsgi.application'
 
 
 
+# PRAGMAs applied to every new SQLite connection (see ragchatbot/db_tuning.py).
+# busy_timeout is kept short: stream writes retry with backoff on top of it
+# (db_tuning.LOCK_RETRIES), and the total must stay well under the worker timeout.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "3000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds the driver waits on a locked database before raising.
+        'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000},
+        # Keep one connection per worker thread instead of reconnecting per request.
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "600")),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+if django.VERSION >= (5, 1):
+    # Take the write lock at BEGIN so a transaction never fails halfway
+    # through on a read-to-write lock upgrade.
+    DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
 
 
 
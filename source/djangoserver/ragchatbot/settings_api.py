@@ -3,8 +3,13 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 
+from django.conf import settings
+
 from .models import LLMSettings
 from .crypto import encrypt_str
+from .pools import invalidate_user
+from .embedding_backends import get_embeddings_for_backend
+from .ingest_jobs import enqueue_backfill_job
 
 DEFAULTS = {
     "provider": "openai",
@@ -36,6 +41,7 @@ def llm_settings_api(request):
 
     payload = json.loads(request.body.decode("utf-8") or "{}")
 
+    previous_provider = obj.provider
     provider = payload.get("provider", obj.provider)
     obj.provider = provider
     obj.model = payload.get("model", obj.model)
@@ -61,4 +67,18 @@ def llm_settings_api(request):
             obj.google_api_key_enc = ""
 
     obj.save()
-    return JsonResponse({"ok": True, "has_api_key": has_key_for_provider(obj.provider)})
+    invalidate_user(request.user.id, kinds=["embeddings", "vectorstores", "llms"])
+
+    # In fan-out mode, switching provider brings existing files into the new
+    # backend in the background so queries can stay on one collection.
+    backfill_job_id = None
+    if provider != previous_provider and getattr(settings, "INGEST_FANOUT_BACKENDS", []):
+        try:
+            get_embeddings_for_backend(request.user, provider)
+            job = enqueue_backfill_job(request.user, provider)
+            backfill_job_id = job.id if job else None
+        except ValueError:
+            pass
+
+    return JsonResponse({"ok": True, "has_api_key": has_key_for_provider(obj.provider),
+                         "backfill_job_id": backfill_job_id})
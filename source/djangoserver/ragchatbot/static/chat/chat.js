@@ -311,18 +311,12 @@
         setSendMode("stop");
 
         try {
-            const history = Array.from(messagesEl.querySelectorAll(".msg")).map((node) => {
-                const role = node.classList.contains("user") ? "user" : "assistant";
-                const content = node.querySelector(".bubble")?.textContent ?? "";
-                return { role, content };
-            });
-
             botMarkdown = "";
             botBubble.innerHTML = "";
 
             await streamSSEPost(
                 "/api/chat/stream/",
-                { chat_id: currentChatId, message: prompt, history },
+                { chat_id: currentChatId, message: prompt },
                 (event, data) => {
                     if (!data) return;
 
@@ -431,7 +425,49 @@
             return;
         }
 
-        uploadStatus.textContent = "Indexed ✓ " + data.files.map(x => `${x.name} (${x.chunks} chunks)`).join(", ");
+        const describe = (job) => job.files.map(x => {
+            if (x.status === "failed") return `${x.name} (failed: ${x.error})`;
+            if (x.status === "skipped") return `${x.name} (unchanged, already indexed)`;
+            if (x.status === "done") return `${x.name} (${x.chunks} chunks)`;
+            if (x.chunks_total) return `${x.name} (${x.chunks}/${x.chunks_total} chunks)`;
+            if (x.pages) return `${x.name} (${x.pages} pages parsed)`;
+            return `${x.name} (queued)`;
+        }).join(", ");
+
+        if (data.status === "done" || data.status === "failed") {
+            uploadStatus.textContent = (data.status === "done" ? "Indexed ✓ " : "Failed: ") + describe(data);
+            return;
+        }
+
+        uploadStatus.textContent = "Indexing... " + describe(data);
+        // Poll rather than hold a stream open: each open stream pins a sync worker.
+        // A 4xx (job gone, logged out) ends it at once; network errors and
+        // 5xx are retried a few times in a row before giving up.
+        let misses = 0;
+        const poll = async () => {
+            const r = await fetch(`/api/rag/jobs/${data.job_id}/`, { credentials: "same-origin" }).catch(() => null);
+            if (r && r.status >= 400 && r.status < 500) {
+                uploadStatus.textContent = `Failed: lost track of the indexing job (HTTP ${r.status})`;
+                return;
+            }
+            const job = r && r.ok ? await r.json().catch(() => null) : null;
+            if (!job) {
+                if (++misses >= 5) {
+                    uploadStatus.textContent = "Failed: can't reach the server to check indexing progress";
+                    return;
+                }
+                setTimeout(poll, 1000 * misses);
+                return;
+            }
+            misses = 0;
+            if (job.status === "done" || job.status === "failed") {
+                uploadStatus.textContent = (job.status === "done" ? "Indexed ✓ " : "Failed: ") + describe(job);
+                return;
+            }
+            uploadStatus.textContent = "Indexing... " + describe(job);
+            setTimeout(poll, 1000);
+        };
+        setTimeout(poll, 1000);
     });
 
     const knowledgeBtn = document.getElementById("knowledgeBtn");
@@ -486,7 +522,7 @@
             btn.addEventListener("click", async () => {
                 const id = btn.getAttribute("data-del");
                 btn.disabled = true;
-                knowledgeStatus.textContent = "Deleting & reindexing...";
+                knowledgeStatus.textContent = "Deleting...";
                 const fd = new FormData();
                 fd.append("id", id);
 
@@ -501,8 +537,9 @@
                 if (!delRes.ok) {
                     knowledgeStatus.textContent = "Delete failed: " + (delData.error || delRes.status);
                 } else {
-                    const r = delData.reindexed;
-                    knowledgeStatus.textContent = `Deleted ✓ Reindexed ${r.files} file(s), ${r.chunks} chunks`;
+                    knowledgeStatus.textContent = delData.reindex_job_id
+                        ? "Deleted ✓ Rebuilding the index in the background"
+                        : `Deleted ✓ Removed ${delData.removed_chunks} chunks`;
                     await refreshKnowledgeList();
                 }
                 btn.disabled = false;
@@ -545,14 +582,16 @@
         clearKnowledgeBtn.disabled = false;
     });
 
-    async function refreshChatList() {
+    async function refreshChatList(cursor = null) {
         if (!chatListEl) return;
 
-        const res = await fetch("/api/chats/", { credentials: "same-origin" });
+        const url = cursor ? `/api/chats/?cursor=${encodeURIComponent(cursor)}` : "/api/chats/";
+        const res = await fetch(url, { credentials: "same-origin" });
         const data = await res.json().catch(() => ({}));
         const chats = data.chats || [];
 
-        chatListEl.innerHTML = "";
+        if (!cursor) chatListEl.innerHTML = "";
+        chatListEl.querySelector(".chat-more-btn")?.remove();
 
         for (const c of chats) {
             const item = document.createElement("div");
@@ -649,6 +688,15 @@
 
             chatListEl.appendChild(item);
         }
+
+        if (data.next_cursor) {
+            const more = document.createElement("button");
+            more.type = "button";
+            more.className = "btn chat-more-btn";
+            more.textContent = "Load more";
+            more.addEventListener("click", () => refreshChatList(data.next_cursor));
+            chatListEl.appendChild(more);
+        }
     }
 
     async function loadChat(chatId) {
@@ -666,9 +714,39 @@
             const role = (m.role === "assistant") ? "bot" : "user";
             addMessage(role, m.content || "");
         }
+        addEarlierButton(chatId, data.before_cursor);
         scrollToBottom();
     }
 
+    function addEarlierButton(chatId, cursor) {
+        if (!cursor) return;
+        const btn = document.createElement("button");
+        btn.type = "button";
+        btn.className = "btn load-earlier";
+        btn.textContent = "Load earlier messages";
+        btn.addEventListener("click", async () => {
+            btn.disabled = true;
+            const res = await fetch(
+                `/api/chats/${chatId}/messages/?before=${encodeURIComponent(cursor)}`,
+                { credentials: "same-origin" }
+            );
+            const data = await res.json().catch(() => ({}));
+            if (!res.ok || String(currentChatId) !== String(chatId)) {
+                btn.disabled = false;
+                return;
+            }
+            btn.remove();
+            const anchor = messagesEl.firstChild;
+            for (const m of data.messages || []) {
+                const role = (m.role === "assistant") ? "bot" : "user";
+                const { wrap } = addMessage(role, m.content || "");
+                messagesEl.insertBefore(wrap, anchor);
+            }
+            addEarlierButton(chatId, data.before_cursor);
+        });
+        messagesEl.insertBefore(btn, messagesEl.firstChild);
+    }
+
     function escapeHtml(s) {
         return (s ?? "").replace(/[&<>"']/g, (c) => ({
             "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#039;"
@@ -1,145 +1,363 @@
+import asyncio
 import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import StreamingHttpResponse
+from django.db import close_old_connections
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 
 from .models import LLMSettings, Chat, Message
-from .crypto import decrypt_str
 from .multi_retriever import retrieve_merged
+from .llm_backends import get_chat_llm
+from .answer_cache import probe_answer_cache
+from .prompt_budget import assemble_messages
+from .chat_history import load_history, schedule_summary
+from .metrics import observe, span
+from .db_tuning import aretry_on_lock, retry_on_lock
 
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 
 SYSTEM_PROMPT = "You are a helpful assistant."
 
+LLM_DEFAULTS = {
+    "provider": "openai",
+    "model": "gpt-4o-mini",
+    "temperature": 0.2,
+    "ollama_base_url": "http://localhost:11434",
+}
+
 def sse(event: str, data: str) -> str:
     return f"event: {event}\ndata: {data}\n\n"
 
+def collect_sources(docs):
+    sources, seen = [], set()
+    for d in docs:
+        s = {"source": d.metadata.get("source", "unknown"),
+             "page": d.metadata.get("page", None)}
+        key = (s["source"], s["page"])
+        if key in seen:
+            continue
+        seen.add(key)
+        sources.append(s)
+    return sources
+
+def replay_chunks(text: str, size: int = 64):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+def _chat_title(prompt: str) -> str:
+    return (prompt[:60] + "...") if len(prompt) > 60 else prompt
+
+class TokenCoalescer:
+    # Buffers tokens and releases them at most every flush_ms or once
+    # max_chars have piled up. flush_ms=0 passes every token straight through.
+    def __init__(self, flush_ms: int, max_chars: int):
+        self.interval = flush_ms / 1000.0
+        self.max_chars = max_chars
+        self.buf = []
+        self.size = 0
+        self.last_flush = 0.0
+
+    def push(self, token: str) -> str:
+        if not token:
+            return ""
+        self.buf.append(token)
+        self.size += len(token)
+        if self.interval <= 0 or self.size >= self.max_chars or time.monotonic() - self.last_flush >= self.interval:
+            return self.flush()
+        return ""
+
+    def flush(self) -> str:
+        out = "".join(self.buf)
+        self.buf, self.size = [], 0
+        self.last_flush = time.monotonic()
+        return out
+
+class AnswerCheckpoint:
+    # Keeps one assistant Message row per answer, saved with is_partial=True
+    # every interval_s so a crashed worker still leaves the text behind.
+    def __init__(self, chat, interval_s: float):
+        self.chat = chat
+        self.interval = interval_s
+        self.message = None
+        self.saved_len = 0
+        self.last_save = time.monotonic()
+
+    def due(self, text: str) -> bool:
+        return (self.interval > 0 and len(text) != self.saved_len
+                and time.monotonic() - self.last_save >= self.interval)
+
+    def save(self, text: str, partial: bool = True):
+        if self.message is None:
+            self.message = retry_on_lock(Message.objects.create, chat=self.chat, role="assistant", content=text, is_partial=partial)
+        else:
+            self.message.content = text
+            self.message.is_partial = partial
+            retry_on_lock(self.message.save, update_fields=["content", "is_partial"])
+        self.saved_len = len(text)
+        self.last_save = time.monotonic()
+
+    async def asave(self, text: str, partial: bool = True):
+        if self.message is None:
+            self.message = await aretry_on_lock(Message.objects.acreate, chat=self.chat, role="assistant", content=text, is_partial=partial)
+        else:
+            self.message.content = text
+            self.message.is_partial = partial
+            await aretry_on_lock(self.message.asave, update_fields=["content", "is_partial"])
+        self.saved_len = len(text)
+        self.last_save = time.monotonic()
+
+def _done_payload(payload: dict, timings: dict) -> str:
+    if getattr(settings, "EXPOSE_TIMINGS", False):
+        payload["timings"] = timings
+    return sse("done", json.dumps(payload))
+
+def _stream_helpers(chat):
+    return (
+        TokenCoalescer(settings.STREAM_COALESCE_MS, settings.STREAM_COALESCE_CHARS),
+        AnswerCheckpoint(chat, settings.STREAM_CHECKPOINT_S),
+    )
+
 @login_required
 @require_POST
 def chat_stream_api(request):
     def generate():
         chat = None
+        checkpoint = None
         assistant_text = ""
+        timings = {}
+        started = time.perf_counter()
 
         try:
             payload = json.loads(request.body.decode("utf-8") or "{}")
             chat_id = payload.get("chat_id")
             prompt = (payload.get("message") or "").strip()
-            history = payload.get("history") or []
 
             if not prompt:
                 yield sse("error", json.dumps({"error": "Empty message"}))
                 return
 
-            if chat_id:
-                chat = Chat.objects.get(id=chat_id, user=request.user)
-            else:
-                chat = Chat.objects.create(user=request.user, title="New chat")
+            with span("chat", "db_write", timings):
+                if chat_id:
+                    chat = Chat.objects.get(id=chat_id, user=request.user)
+                else:
+                    chat = retry_on_lock(Chat.objects.create, user=request.user, title="New chat")
+                user_msg = retry_on_lock(Message.objects.create, chat=chat, role="user", content=prompt)
+
+            with span("chat", "history", timings):
+                history = load_history(chat, exclude_id=user_msg.id)
+
+            with span("chat", "db_write", timings):
+                if chat.title == "New chat":
+                    chat.title = _chat_title(prompt)
+                    retry_on_lock(chat.save, update_fields=["title", "updated_at"])
+                else:
+                    retry_on_lock(chat.save, update_fields=["updated_at"])
+
+            retrieval = {}
+            with span("chat", "retrieve", timings):
+                docs = retrieve_merged(request.user, prompt, k_per_backend=3, k_total=4, max_distance=0.55, stats=retrieval)
+
+            sources = collect_sources(docs)
+            yield sse("sources", json.dumps({"sources": sources, "backends": retrieval}))
+
+            cfg, _ = LLMSettings.objects.get_or_create(user=request.user, defaults=LLM_DEFAULTS)
+            with span("chat", "prompt", timings):
+                messages, prompt_report = assemble_messages(SYSTEM_PROMPT, prompt, docs, history, cfg.model, chat.summary)
+
+            with span("chat", "answer_cache", timings):
+                probe = probe_answer_cache(request.user, prompt, docs, history, cfg)
+            if probe and probe.answer is not None:
+                yield sse("start", json.dumps({"ok": True, "chat_id": chat.id}))
+                for piece in replay_chunks(probe.answer):
+                    yield sse("token", json.dumps({"token": piece}))
+                with span("chat", "db_write", timings):
+                    retry_on_lock(Message.objects.create, chat=chat, role="assistant", content=probe.answer, is_partial=False)
+                    retry_on_lock(chat.save, update_fields=["updated_at"])
+                observe("chat", "total", time.perf_counter() - started, timings)
+                yield _done_payload({"ok": True, "chat_id": chat.id, "cached": True}, timings)
+                return
+
+            with span("chat", "llm_init", timings):
+                llm = get_chat_llm(cfg)
+
+            yield sse("start", json.dumps({"ok": True, "chat_id": chat.id}))
+
+            coalescer, checkpoint = _stream_helpers(chat)
+            generating = time.perf_counter()
+            first_token = True
+            for chunk in llm.stream(messages):
+                token = chunk.content or ""
+                if first_token and token:
+                    first_token = False
+                    observe("chat", "ttft", time.perf_counter() - started, timings)
+                assistant_text += token
+                out = coalescer.push(token)
+                if out:
+                    yield sse("token", json.dumps({"token": out}))
+                if checkpoint.due(assistant_text):
+                    checkpoint.save(assistant_text)
+
+            out = coalescer.flush()
+            if out:
+                yield sse("token", json.dumps({"token": out}))
+            observe("chat", "generate", time.perf_counter() - generating, timings)
+
+            with span("chat", "db_write", timings):
+                checkpoint.save(assistant_text, partial=False)
+                retry_on_lock(chat.save, update_fields=["updated_at"])
+            if probe:
+                probe.store(assistant_text)
+            schedule_summary(chat.id)
+            observe("chat", "total", time.perf_counter() - started, timings)
+            yield _done_payload({"ok": True, "chat_id": chat.id, "prompt": prompt_report}, timings)
+
+        except GeneratorExit:
+            if chat and assistant_text.strip():
+                if checkpoint is None:
+                    checkpoint = AnswerCheckpoint(chat, 0)
+                checkpoint.save(assistant_text)
+                retry_on_lock(chat.save, update_fields=["updated_at"])
+            raise
+
+        except Exception as e:
+            yield sse("error", json.dumps({"error": str(e)}))
 
-            Message.objects.create(chat=chat, role="user", content=prompt)
+    resp = StreamingHttpResponse(generate(), content_type="text/event-stream; charset=utf-8")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
 
-            if chat.title == "New chat":
-                chat.title = (prompt[:60] + "...") if len(prompt) > 60 else prompt
-                chat.save(update_fields=["title", "updated_at"])
-            else:
-                chat.save(update_fields=["updated_at"])
+def _off_thread(fn):
+    # Retrieval, the cache probe and LLM setup are mostly remote calls. The
+    # default thread_sensitive=True would queue every stream's calls on one
+    # shared thread, so run them on the executor instead; their few ORM reads
+    # use that thread's own connection, tidied up afterwards.
+    def run(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
 
-            docs = retrieve_merged(request.user, prompt, k_per_backend=3, k_total=4, max_distance=0.55)
+async def chat_stream_async_api(request):
+    # login_required/require_POST only wrap async views from Django 5.x on,
+    # so the checks are done inline to keep 4.2 working.
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
 
-            def _src(d):
+    async def generate():
+        chat = None
+        assistant_text = ""
+        timings = {}
+        started = time.perf_counter()
 
-                return {"source": d.metadata.get("source", "unknown"),
-                        "page": d.metadata.get("page", None)}
+        checkpoint = None
 
-            sources, seen = [], set()
-            for d in docs:
-                s = _src(d)
-                key = (s["source"], s["page"])
-                if key in seen:
-                    continue
-                seen.add(key)
-                sources.append(s)
+        async def save_partial():
+            nonlocal checkpoint
+            if chat and assistant_text.strip():
+                if checkpoint is None:
+                    checkpoint = AnswerCheckpoint(chat, 0)
+                await checkpoint.asave(assistant_text)
+                await aretry_on_lock(chat.asave, update_fields=["updated_at"])
 
-            yield sse("sources", json.dumps({"sources": sources}))
+        try:
+            payload = json.loads(request.body.decode("utf-8") or "{}")
+            chat_id = payload.get("chat_id")
+            prompt = (payload.get("message") or "").strip()
+
+            if not prompt:
+                yield sse("error", json.dumps({"error": "Empty message"}))
+                return
+
+            with span("chat", "db_write", timings):
+                if chat_id:
+                    chat = await Chat.objects.aget(id=chat_id, user=user)
+                else:
+                    chat = await aretry_on_lock(Chat.objects.acreate, user=user, title="New chat")
+                user_msg = await aretry_on_lock(Message.objects.acreate, chat=chat, role="user", content=prompt)
 
-            context = "\n\n".join(
-                [f"[{i+1}] {d.metadata.get('source','')} p{d.metadata.get('page','?')}\n{d.page_content}"
-                 for i, d in enumerate(docs)]
-            )
+            with span("chat", "history", timings):
+                history = await sync_to_async(load_history)(chat, exclude_id=user_msg.id)
 
-            messages = [SystemMessage(content=SYSTEM_PROMPT)]
+            with span("chat", "db_write", timings):
+                if chat.title == "New chat":
+                    chat.title = _chat_title(prompt)
+                    await aretry_on_lock(chat.asave, update_fields=["title", "updated_at"])
+                else:
+                    await aretry_on_lock(chat.asave, update_fields=["updated_at"])
 
-            if docs:
-                context = "\n\n".join(
-                    [f"[{i+1}] {d.metadata.get('source','')} p{d.metadata.get('page','?')}\n{d.page_content}"
-                     for i, d in enumerate(docs)]
+            retrieval = {}
+            with span("chat", "retrieve", timings):
+                docs = await _off_thread(retrieve_merged)(
+                    user, prompt, k_per_backend=3, k_total=4, max_distance=0.55, stats=retrieval
                 )
-                messages.append(SystemMessage(content=f"Use the following retrieved context when helpful:\n\n{context}"))
-
-            for item in history:
-                role = item.get("role")
-                content = item.get("content", "")
-                if role == "user":
-                    messages.append(HumanMessage(content=content))
-                elif role == "assistant":
-                    messages.append(AIMessage(content=content))
-
-            messages.append(HumanMessage(content=prompt))
-
-            cfg, _ = LLMSettings.objects.get_or_create(
-                user=request.user,
-                defaults={
-                    "provider": "openai",
-                    "model": "gpt-4o-mini",
-                    "temperature": 0.2,
-                    "ollama_base_url": "http://localhost:11434",
-                }
-            )
-
-            provider = cfg.provider
-            model = cfg.model
-            temperature = cfg.temperature
-
-            if provider == "openai":
-                api_key = decrypt_str(cfg.openai_api_key_enc)
-                if not api_key:
-                    raise ValueError("OpenAI API key is missing. Add it in Settings.")
-                llm = ChatOpenAI(model=model, temperature=temperature, streaming=True, api_key=api_key)
-
-            elif provider == "google":
-                api_key = decrypt_str(cfg.google_api_key_enc)
-                if not api_key:
-                    raise ValueError("Google API key is missing. Add it in Settings.")
-                from langchain_google_genai import ChatGoogleGenerativeAI
-                llm = ChatGoogleGenerativeAI(model=model, temperature=temperature, google_api_key=api_key, streaming=True)
-
-            elif provider == "ollama":
-                from langchain_ollama import ChatOllama
-                llm = ChatOllama(
-                    model=model,
-                    temperature=temperature,
-                    base_url=(cfg.ollama_base_url or "http://localhost:11434"),
-                    streaming=True
+
+            sources = collect_sources(docs)
+            yield sse("sources", json.dumps({"sources": sources, "backends": retrieval}))
+
+            cfg, _ = await LLMSettings.objects.aget_or_create(user=user, defaults=LLM_DEFAULTS)
+            with span("chat", "prompt", timings):
+                messages, prompt_report = await _off_thread(assemble_messages)(
+                    SYSTEM_PROMPT, prompt, docs, history, cfg.model, chat.summary
                 )
-            else:
-                raise ValueError(f"Unknown provider: {provider}")
+
+            with span("chat", "answer_cache", timings):
+                probe = await _off_thread(probe_answer_cache)(user, prompt, docs, history, cfg)
+            if probe and probe.answer is not None:
+                yield sse("start", json.dumps({"ok": True, "chat_id": chat.id}))
+                for piece in replay_chunks(probe.answer):
+                    yield sse("token", json.dumps({"token": piece}))
+                with span("chat", "db_write", timings):
+                    await aretry_on_lock(Message.objects.acreate, chat=chat, role="assistant", content=probe.answer, is_partial=False)
+                    await aretry_on_lock(chat.asave, update_fields=["updated_at"])
+                observe("chat", "total", time.perf_counter() - started, timings)
+                yield _done_payload({"ok": True, "chat_id": chat.id, "cached": True}, timings)
+                return
+
+            with span("chat", "llm_init", timings):
+                llm = await _off_thread(get_chat_llm)(cfg)
 
             yield sse("start", json.dumps({"ok": True, "chat_id": chat.id}))
 
-            for chunk in llm.stream(messages):
+            coalescer, checkpoint = _stream_helpers(chat)
+            generating = time.perf_counter()
+            first_token = True
+            async for chunk in llm.astream(messages):
                 token = chunk.content or ""
+                if first_token and token:
+                    first_token = False
+                    observe("chat", "ttft", time.perf_counter() - started, timings)
                 assistant_text += token
-                yield sse("token", json.dumps({"token": token}))
+                out = coalescer.push(token)
+                if out:
+                    yield sse("token", json.dumps({"token": out}))
+                if checkpoint.due(assistant_text):
+                    await checkpoint.asave(assistant_text)
 
-            Message.objects.create(chat=chat, role="assistant", content=assistant_text, is_partial=False)
-            chat.save(update_fields=["updated_at"])
-            yield sse("done", json.dumps({"ok": True, "chat_id": chat.id}))
+            out = coalescer.flush()
+            if out:
+                yield sse("token", json.dumps({"token": out}))
+            observe("chat", "generate", time.perf_counter() - generating, timings)
 
-        except GeneratorExit:
-            if chat and assistant_text.strip():
-                Message.objects.create(chat=chat, role="assistant", content=assistant_text, is_partial=True)
-                chat.save(update_fields=["updated_at"])
+            with span("chat", "db_write", timings):
+                await checkpoint.asave(assistant_text, partial=False)
+                await aretry_on_lock(chat.asave, update_fields=["updated_at"])
+            if probe:
+                probe.store(assistant_text)
+            schedule_summary(chat.id)
+            observe("chat", "total", time.perf_counter() - started, timings)
+            yield _done_payload({"ok": True, "chat_id": chat.id, "prompt": prompt_report}, timings)
+
+        except (GeneratorExit, asyncio.CancelledError):
+            # Django cancels the generator when the client disconnects; the
+            # save must finish even though this task is being cancelled.
+            await asyncio.shield(save_partial())
             raise
 
         except Exception as e:
@@ -5,11 +5,13 @@ from django.conf import settings
 from django.conf.urls.static import static
 from .views import chat_page
 from .auth_views import signup_view
-from .stream_api import chat_stream_api
+from .stream_api import chat_stream_api, chat_stream_async_api
 from .settings_api import llm_settings_api
-from .rag_api import upload_and_ingest
+from .rag_api import upload_and_ingest, backfill_backend
+from .jobs_api import ingest_job_api, ingest_job_stream_api
 from .knowledge_api import list_knowledge_files, delete_knowledge_file, clear_knowledge
 from .chat_api import chats_api, chat_messages_api, rename_chat_api, delete_chat_api
+from .metrics_api import metrics_api
 
 urlpatterns = [
     path("", login_required(chat_page), name="chat"),
@@ -18,8 +20,15 @@ urlpatterns = [
     path("signup/", signup_view, name="signup"),
 
     path("api/settings/", llm_settings_api, name="llm_settings_api"),
-    path("api/chat/stream/", chat_stream_api, name="chat_stream_api"),
+    path(
+        "api/chat/stream/",
+        chat_stream_async_api if settings.CHAT_STREAM_ASYNC else chat_stream_api,
+        name="chat_stream_api",
+    ),
     path("api/rag/upload/", upload_and_ingest, name="upload_and_ingest"),
+    path("api/rag/backfill/", backfill_backend, name="backfill_backend"),
+    path("api/rag/jobs/<int:job_id>/", ingest_job_api, name="ingest_job_api"),
+    path("api/rag/jobs/<int:job_id>/stream/", ingest_job_stream_api, name="ingest_job_stream_api"),
     path("api/rag/files/", list_knowledge_files, name="list_knowledge_files"),
     path("api/rag/files/delete/", delete_knowledge_file, name="delete_knowledge_file"),
     path("api/rag/clear/", clear_knowledge, name="clear_knowledge"),
@@ -27,4 +36,5 @@ urlpatterns = [
     path("api/chats/<int:chat_id>/messages/", chat_messages_api),
     path("api/chats/<int:chat_id>/rename/", rename_chat_api),
     path("api/chats/<int:chat_id>/delete/", delete_chat_api),
+    path("metrics", metrics_api, name="metrics"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
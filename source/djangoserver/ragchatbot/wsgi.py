@@ -5,3 +5,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ragchatbot.settings')
 
 application = get_wsgi_application()
+
+from ragchatbot.rerank import warm_up  # noqa: E402
+
+warm_up()